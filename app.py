@@ -1,30 +1,52 @@
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, BackgroundTasks
+from fastapi import FastAPI, Depends, HTTPException, Query, Request, Response
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, FileResponse
+from fastapi.responses import HTMLResponse, FileResponse, StreamingResponse
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Tuple
 import os
-import shutil
+import json
+import base64
+import asyncio
+import logging
+import threading
 from datetime import datetime
 
-from database import init_db, get_db, Podcast, Transcription, ChatSession, ChatMessage
-from transcription_service import transcribe_audio
+from database import (
+    init_db, get_db, get_async_db, SessionLocal, AsyncSessionLocal,
+    Podcast, Transcription, ChatSession, ChatMessage, TranscriptionJob
+)
+from job_queue import enqueue_transcription, start_workers
+from chat_history import load_recent_history, get_messages_page
+from audio_streaming import AudioFileResponse
+from upload_streaming import SavedUpload, receive_upload
+import summarizer
 from chatbot_service import ChatbotService
-from vector_store import VectorStore
+from vector_store import get_vector_store
 from dotenv import load_dotenv
 load_dotenv()
 import os
+
+# Level of the service loggers (e.g. prompt token counts per chat turn at INFO)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+logging.basicConfig(level=LOG_LEVEL, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
 app = FastAPI(title="Podcast Chatbot API")
 
 # Initialize services
-chatbot_service = ChatbotService()
-vector_store = VectorStore()
+vector_store = get_vector_store()
+chatbot_service = ChatbotService(vector_store)
 
 # Create upload directory
 UPLOAD_DIR = os.getenv("UPLOAD_DIR", "./uploads")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
+# Largest accepted upload in bytes (default 2GB)
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", str(2 * 1024 * 1024 * 1024)))
+
 # Initialize database
 init_db()
 
@@ -35,9 +57,16 @@ class ChatRequest(BaseModel):
     session_id: Optional[int] = None
 
 
+class ChatSource(BaseModel):
+    text: str
+    start: float
+    end: float
+
+
 class ChatResponse(BaseModel):
     response: str
     session_id: int
+    sources: List[ChatSource] = []
 
 
 class PodcastResponse(BaseModel):
@@ -55,6 +84,12 @@ class TranscriptionResponse(BaseModel):
     created_at: datetime
 
 
+class SummaryResponse(BaseModel):
+    podcast_id: int
+    summary: str
+    created_at: datetime
+
+
 class MessageResponse(BaseModel):
     id: int
     role: str
@@ -62,93 +97,245 @@ class MessageResponse(BaseModel):
     timestamp: datetime
 
 
-# Background task for transcription
-def process_transcription(podcast_id: int, file_path: str, db_session):
-    """Background task to process podcast transcription"""
-    from database import SessionLocal
+class SearchResult(BaseModel):
+    podcast_id: int
+    podcast_title: str
+    text: str
+    distance: Optional[float] = None
+    start: Optional[float] = None
+    end: Optional[float] = None
+
+
+def reconcile_vector_store():
+    """Rebuild missing vector store collections for completed podcasts"""
     db = SessionLocal()
 
     try:
-        # Update status to processing
-        podcast = db.query(Podcast).filter(Podcast.id == podcast_id).first()
-        podcast.transcription_status = "processing"
-        db.commit()
+        transcriptions = db.query(Transcription).join(Podcast).filter(
+            Podcast.transcription_status == "completed"
+        ).all()
+
+        for transcription in transcriptions:
+            try:
+                if vector_store.is_indexed(transcription.podcast_id):
+                    continue
+                vector_store.create_collection_for_podcast(
+                    transcription.podcast_id,
+                    transcription.full_text,
+                    [
+                        {"start": segment.start, "end": segment.end, "text": segment.text}
+                        for segment in transcription.segments
+                    ]
+                )
+                print(f"Rebuilt vector store for podcast {transcription.podcast_id}")
+            except Exception as e:
+                print(f"Vector store rebuild failed for podcast {transcription.podcast_id}: {str(e)}")
+    finally:
+        db.close()
 
-        # Transcribe audio
-        result = transcribe_audio(file_path)
 
-        # Save transcription
-        transcription = Transcription(
-            podcast_id=podcast_id,
-            full_text=result["text"],
-            duration=result.get("duration")
-        )
-        db.add(transcription)
+@app.on_event("startup")
+def start_vector_store_reconciliation():
+    """Rebuild missing collections in the background so startup is not blocked"""
+    threading.Thread(target=reconcile_vector_store, daemon=True).start()
+
+
+@app.on_event("startup")
+def start_transcription_workers():
+    """Resume interrupted transcription jobs and start the worker pool"""
+    app.state.transcription_workers = start_workers()
 
-        # Create vector store
-        vector_store.create_collection_for_podcast(podcast_id, result["text"])
 
-        # Update status to completed
-        podcast.transcription_status = "completed"
+@app.on_event("shutdown")
+def stop_transcription_workers():
+    """Signal transcription workers to stop after their current job"""
+    workers = getattr(app.state, "transcription_workers", None)
+    if workers is not None:
+        workers.set()
+
+
+def find_duplicate_podcast(db: Session, content_hash: str, new_file_path: str) -> Optional[Podcast]:
+    """
+    Find a podcast whose audio has the same content hash as a new upload
+
+    When one exists the newly saved copy is removed, and a failed
+    transcription of the existing podcast is queued again.
+
+    Returns:
+        The existing podcast, or None if the upload is new
+    """
+    podcast = db.query(Podcast).filter(Podcast.content_hash == content_hash).first()
+    if not podcast:
+        return None
+
+    if not os.path.exists(podcast.file_path):
+        # The original file is gone; keep the new copy instead
+        podcast.file_path = new_file_path
         db.commit()
+    elif os.path.exists(new_file_path):
+        os.remove(new_file_path)
 
-    except Exception as e:
-        podcast = db.query(Podcast).filter(Podcast.id == podcast_id).first()
-        podcast.transcription_status = "failed"
+    if podcast.transcription_status == "failed":
+        podcast.transcription_status = "pending"
         db.commit()
-        print(f"Transcription failed: {str(e)}")
-    finally:
-        db.close()
+        enqueue_transcription(db, podcast.id, podcast.file_path)
+
+    return podcast
+
+
+def register_upload(db: Session, upload: SavedUpload, title: str) -> PodcastResponse:
+    """
+    Record a saved upload as a podcast and queue its transcription
+
+    Reuses the podcast of an identical earlier upload. Commits and file
+    removal block, so upload_podcast runs this in a worker thread.
+    """
+    # Reuse the file, transcription and vector collection of an identical upload
+    podcast = find_duplicate_podcast(db, upload.content_hash, upload.file_path)
+    if podcast is None:
+        podcast = Podcast(
+            title=title,
+            filename=upload.filename,
+            file_path=upload.file_path,
+            transcription_status="pending",
+            content_hash=upload.content_hash
+        )
+        db.add(podcast)
+        try:
+            db.commit()
+        except IntegrityError:
+            # An identical file was registered concurrently
+            db.rollback()
+            podcast = find_duplicate_podcast(db, upload.content_hash, upload.file_path)
+        else:
+            db.refresh(podcast)
+            # Queue transcription for the worker pool
+            enqueue_transcription(db, podcast.id, upload.file_path)
+
+    # Built here so serializing the response does not load expired attributes on the event loop
+    return PodcastResponse(
+        id=podcast.id,
+        title=podcast.title,
+        filename=podcast.filename,
+        upload_date=podcast.upload_date,
+        transcription_status=podcast.transcription_status
+    )
+
+
+ALLOWED_EXTENSIONS = [".mp3", ".wav", ".m4a", ".mp4", ".mpeg", ".mpga", ".webm"]
+
+
+def upload_path(filename: str) -> str:
+    """Validate the file type of an upload and return where to save it"""
+    file_ext = os.path.splitext(filename)[1].lower()
+    if file_ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Invalid file type. Allowed: {', '.join(ALLOWED_EXTENSIONS)}"
+        )
+
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.path.join(UPLOAD_DIR, f"{timestamp}_{filename}")
 
 
 # API Endpoints
-@app.post("/api/podcasts/upload", response_model=PodcastResponse)
+@app.post(
+    "/api/podcasts/upload",
+    response_model=PodcastResponse,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}}
+                    }
+                }
+            }
+        }
+    }
+)
 async def upload_podcast(
-    background_tasks: BackgroundTasks,
+    request: Request,
     title: str,
-    file: UploadFile = File(...),
     db: Session = Depends(get_db)
 ):
-    """Upload a podcast audio file"""
-    # Validate file type
-    allowed_extensions = [".mp3", ".wav", ".m4a", ".mp4", ".mpeg", ".mpga", ".webm"]
-    file_ext = os.path.splitext(file.filename)[1].lower()
+    """
+    Upload a podcast audio file
 
-    if file_ext not in allowed_extensions:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Invalid file type. Allowed: {', '.join(allowed_extensions)}"
-        )
+    The form is parsed as it arrives and the file streamed straight to disk;
+    uploads over MAX_UPLOAD_SIZE are rejected with 413. The database work
+    then runs in a worker thread, so waiting on a locked database does not
+    stall the event loop.
+    """
+    upload = await receive_upload(request, upload_path, MAX_UPLOAD_SIZE)
+    return await asyncio.to_thread(register_upload, db, upload, title)
 
-    # Save file
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"{timestamp}_{file.filename}"
-    file_path = os.path.join(UPLOAD_DIR, filename)
-
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Create database entry
-    podcast = Podcast(
-        title=title,
-        filename=file.filename,
-        file_path=file_path,
-        transcription_status="pending"
-    )
-    db.add(podcast)
-    db.commit()
-    db.refresh(podcast)
 
-    # Start transcription in background
-    background_tasks.add_task(process_transcription, podcast.id, file_path, db)
+def encode_cursor(*values) -> str:
+    """Encode keyset pagination values as an opaque cursor string"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
 
-    return podcast
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Decode a (timestamp, id) cursor produced by encode_cursor
+
+    Raises:
+        HTTPException: 400 if the cursor is not a well-formed (timestamp, id) pair
+    """
+    try:
+        timestamp, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(last_id, int) or isinstance(last_id, bool):
+            raise ValueError("cursor id is not an integer")
+        return datetime.fromisoformat(timestamp), last_id
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 
 @app.get("/api/podcasts", response_model=List[PodcastResponse])
-def get_podcasts(db: Session = Depends(get_db)):
-    """Get all podcasts"""
-    podcasts = db.query(Podcast).order_by(Podcast.upload_date.desc()).all()
+def get_podcasts(
+    response: Response,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = None,
+    status: Optional[str] = None,
+    q: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get podcasts, newest first, one page at a time
+
+    Filter with status (transcription status) and q (title prefix). When
+    more results exist, the X-Next-Cursor response header holds the cursor
+    for the next page.
+    """
+    query = db.query(Podcast)
+
+    if status:
+        query = query.filter(Podcast.transcription_status == status)
+    if q:
+        # Range comparison so the title index is used for the prefix match; the
+        # bound is the highest code point so titles continuing with emoji still match
+        query = query.filter(Podcast.title >= q, Podcast.title < q + "\U0010ffff")
+    if cursor:
+        upload_date, last_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            Podcast.upload_date < upload_date,
+            and_(Podcast.upload_date == upload_date, Podcast.id < last_id)
+        ))
+
+    podcasts = query.order_by(
+        Podcast.upload_date.desc(),
+        Podcast.id.desc()
+    ).limit(limit + 1).all()
+
+    if len(podcasts) > limit:
+        podcasts = podcasts[:limit]
+        last = podcasts[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.upload_date.isoformat(), last.id)
+
     return podcasts
 
 
@@ -161,6 +348,25 @@ def get_podcast(podcast_id: int, db: Session = Depends(get_db)):
     return podcast
 
 
+@app.api_route("/api/podcasts/{podcast_id}/audio", methods=["GET", "HEAD"])
+def stream_podcast_audio(podcast_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Stream the uploaded audio of a podcast
+
+    Supports Range requests so players can seek (e.g. to the start time of a
+    search result) without downloading the whole file, and ETag /
+    Last-Modified validation so repeat plays are answered with 304.
+    """
+    podcast = db.query(Podcast).filter(Podcast.id == podcast_id).first()
+    if not podcast:
+        raise HTTPException(status_code=404, detail="Podcast not found")
+
+    if not os.path.isfile(podcast.file_path):
+        raise HTTPException(status_code=404, detail="Audio file not found")
+
+    return AudioFileResponse(podcast.file_path, request.headers, request.method)
+
+
 @app.get("/api/podcasts/{podcast_id}/transcription", response_model=TranscriptionResponse)
 def get_transcription(podcast_id: int, db: Session = Depends(get_db)):
     """Get transcription for a podcast"""
@@ -174,15 +380,16 @@ def get_transcription(podcast_id: int, db: Session = Depends(get_db)):
     return transcription
 
 
-@app.post("/api/podcasts/{podcast_id}/chat", response_model=ChatResponse)
-def chat_with_podcast(
-    podcast_id: int,
-    request: ChatRequest,
-    db: Session = Depends(get_db)
-):
-    """Chat with a podcast using its transcription"""
+async def prepare_chat(podcast_id: int, request: ChatRequest, db: AsyncSession):
+    """
+    Validate the podcast and load the chat session and its history
+
+    Returns:
+        Tuple of (chat session, chat history as role/content dicts,
+        transcription version for the answer cache)
+    """
     # Verify podcast exists and has transcription
-    podcast = db.query(Podcast).filter(Podcast.id == podcast_id).first()
+    podcast = await db.get(Podcast, podcast_id)
     if not podcast:
         raise HTTPException(status_code=404, detail="Podcast not found")
 
@@ -194,65 +401,215 @@ def chat_with_podcast(
 
     # Get or create chat session
     if request.session_id:
-        session = db.query(ChatSession).filter(ChatSession.id == request.session_id).first()
+        session = await db.get(ChatSession, request.session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Chat session not found")
     else:
         session = ChatSession(podcast_id=podcast_id)
         db.add(session)
-        db.commit()
-        db.refresh(session)
+        await db.commit()
+        await db.refresh(session)
 
-    # Get chat history
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session.id
-    ).order_by(ChatMessage.timestamp).all()
-
-    chat_history = [
-        {"role": msg.role, "content": msg.content}
-        for msg in messages
-    ]
+    # Get the recent chat history used in the prompt
+    chat_history = await load_recent_history(db, session.id)
 
-    # Generate response
-    response_text = chatbot_service.generate_response(
-        podcast_id,
-        request.message,
-        chat_history
+    # Cached answers are only reused for the transcription they were built from
+    transcription_version = await db.scalar(
+        select(Transcription.created_at).filter(Transcription.podcast_id == podcast_id)
     )
 
-    # Save messages
+    return session, chat_history, transcription_version
+
+
+async def save_chat_turn(db: AsyncSession, session_id: int, user_text: str, response_text: str):
+    """Persist a user message and the assistant reply"""
     user_message = ChatMessage(
-        session_id=session.id,
+        session_id=session_id,
         role="user",
-        content=request.message
+        content=user_text
     )
     assistant_message = ChatMessage(
-        session_id=session.id,
+        session_id=session_id,
         role="assistant",
         content=response_text
     )
 
     db.add(user_message)
     db.add(assistant_message)
-    db.commit()
+    await db.commit()
+
+
+@app.get("/api/podcasts/{podcast_id}/summary", response_model=SummaryResponse)
+def get_summary(podcast_id: int, refresh: bool = False, db: Session = Depends(get_db)):
+    """
+    Get a summary of the whole podcast
+
+    The summary is generated on first request with map-reduce over the full
+    transcription and stored; refresh=true has the model write a new episode
+    summary, reusing cached section summaries.
+    """
+    transcription = db.query(Transcription).filter(
+        Transcription.podcast_id == podcast_id
+    ).first()
+
+    if not transcription:
+        raise HTTPException(status_code=404, detail="Transcription not found")
+
+    if refresh or not transcription.summary:
+        try:
+            transcription.summary = summarizer.summarize_transcription(transcription.full_text, refresh=refresh)
+        except Exception as e:
+            raise HTTPException(status_code=502, detail=f"Error generating summary: {str(e)}")
+        transcription.summary_created_at = datetime.utcnow()
+        db.commit()
+
+    return SummaryResponse(
+        podcast_id=podcast_id,
+        summary=transcription.summary,
+        created_at=transcription.summary_created_at
+    )
+
+
+@app.post("/api/podcasts/{podcast_id}/chat", response_model=ChatResponse)
+async def chat_with_podcast(
+    podcast_id: int,
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Chat with a podcast using its transcription"""
+    session, chat_history, transcription_version = await prepare_chat(podcast_id, request, db)
+
+    # Generate response
+    sources = []
+    response_text = await chatbot_service.agenerate_response(
+        podcast_id,
+        request.message,
+        chat_history,
+        sources=sources,
+        transcription_version=transcription_version
+    )
+
+    # Save messages
+    await save_chat_turn(db, session.id, request.message, response_text)
+
+    return ChatResponse(response=response_text, session_id=session.id, sources=sources)
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.post("/api/podcasts/{podcast_id}/chat/stream")
+async def chat_with_podcast_stream(
+    podcast_id: int,
+    request: ChatRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Chat with a podcast, streaming the answer as Server-Sent Events
+
+    Emits a "session" event with the session id, a "sources" event with the
+    time ranges of the excerpts used, "token" events with text deltas, and a
+    final "done" event once the answer has been saved.
+    """
+    session, chat_history, transcription_version = await prepare_chat(podcast_id, request, db)
+    session_id = session.id
+
+    sources = []
+    pieces = await chatbot_service.agenerate_response(
+        podcast_id,
+        request.message,
+        chat_history,
+        stream=True,
+        sources=sources,
+        transcription_version=transcription_version
+    )
+
+    async def event_stream():
+        yield sse_event("session", {"session_id": session_id})
+        yield sse_event("sources", {"sources": sources})
 
-    return ChatResponse(response=response_text, session_id=session.id)
+        response_parts = []
+        async for piece in pieces:
+            response_parts.append(piece)
+            yield sse_event("token", {"delta": piece})
+
+        # The request-scoped session may already be closed, so save with a fresh one
+        async with AsyncSessionLocal() as stream_db:
+            await save_chat_turn(stream_db, session_id, request.message, "".join(response_parts))
+
+        yield sse_event("done", {"session_id": session_id})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 
 @app.get("/api/sessions/{session_id}/messages", response_model=List[MessageResponse])
-def get_session_messages(session_id: int, db: Session = Depends(get_db)):
-    """Get all messages from a chat session"""
+def get_session_messages(
+    session_id: int,
+    response: Response,
+    limit: int = Query(100, ge=1, le=500),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Get messages from a chat session, oldest first, one page at a time
+
+    When more messages exist, the X-Next-Cursor response header holds the
+    cursor for the next page.
+    """
     session = db.query(ChatSession).filter(ChatSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    messages = db.query(ChatMessage).filter(
-        ChatMessage.session_id == session_id
-    ).order_by(ChatMessage.timestamp).all()
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+
+    messages, has_more = get_messages_page(db, session_id, limit, after)
+
+    if has_more:
+        last = messages[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.timestamp.isoformat(), last.id)
 
     return messages
 
 
+@app.get("/api/search", response_model=List[SearchResult])
+async def search_podcasts(
+    q: str = Query(..., min_length=1),
+    limit: int = Query(10, ge=1, le=100),
+    podcast_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Search transcription chunks across all podcasts
+
+    Runs one nearest-neighbour query on the global collection instead of
+    one per podcast. Pass podcast_id to restrict the search to one podcast.
+    """
+    try:
+        results = await vector_store.asearch_all(q, limit, podcast_id)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Error searching podcasts: {str(e)}")
+
+    podcast_ids = {result['podcast_id'] for result in results}
+    titles = dict((await db.execute(
+        select(Podcast.id, Podcast.title).filter(Podcast.id.in_(podcast_ids))
+    )).all()) if podcast_ids else {}
+
+    # Skip chunks of podcasts deleted while the search ran
+    return [
+        SearchResult(podcast_title=titles[result['podcast_id']], **result)
+        for result in results
+        if result['podcast_id'] in titles
+    ]
+
+
 @app.delete("/api/podcasts/{podcast_id}")
 def delete_podcast(podcast_id: int, db: Session = Depends(get_db)):
     """Delete a podcast and its data"""
@@ -264,8 +621,13 @@ def delete_podcast(podcast_id: int, db: Session = Depends(get_db)):
     if os.path.exists(podcast.file_path):
         os.remove(podcast.file_path)
 
-    # Delete vector store
+    # Delete vector store and cached answers
     vector_store.delete_podcast_collection(podcast_id)
+    if chatbot_service.response_cache is not None:
+        chatbot_service.response_cache.invalidate(podcast_id)
+
+    # Drop queued transcription jobs
+    db.query(TranscriptionJob).filter(TranscriptionJob.podcast_id == podcast_id).delete()
 
     # Delete from database (cascade will handle related records)
     db.delete(podcast)
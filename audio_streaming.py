@@ -0,0 +1,179 @@
+import mimetypes
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Optional, Tuple
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Bytes read and sent per step when the server cannot send the file itself
+AUDIO_CHUNK_SIZE = int(os.getenv("AUDIO_CHUNK_SIZE", str(256 * 1024)))
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def file_etag(stat_result: os.stat_result) -> str:
+    """Build an ETag from a file's modification time and size"""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a Range header into a single byte range
+
+    Args:
+        header: Value of the Range header, e.g. "bytes=0-1023" or "bytes=-500"
+        size: Size of the file in bytes
+
+    Returns:
+        (start, end) with end exclusive, or None when the header should be
+        ignored (other units, malformed or multiple ranges)
+
+    Raises:
+        RangeNotSatisfiable: If the range starts beyond the end of the file
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    first, _, last = spec.strip().partition("-")
+    try:
+        if not first:
+            # Suffix range: the last N bytes
+            length = int(last)
+            if length <= 0:
+                raise RangeNotSatisfiable()
+            return max(0, size - length), size
+        start = int(first)
+        end = int(last) + 1 if last else size
+    except ValueError:
+        return None
+
+    if start >= size or start < 0:
+        raise RangeNotSatisfiable()
+    if end <= start:
+        return None
+    return start, min(end, size)
+
+
+def _not_modified(headers, etag: str, mtime: float) -> bool:
+    """Evaluate If-None-Match and If-Modified-Since against the file"""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class AudioFileResponse(Response):
+    """
+    Serve a file, or one byte range of it, for audio playback
+
+    Honours Range, If-Range, If-None-Match and If-Modified-Since. The body is
+    handed to the server with the ASGI zero-copy send extension when it is
+    available, so the kernel copies the file to the socket; otherwise it is
+    read and sent in AUDIO_CHUNK_SIZE pieces.
+    """
+
+    def __init__(self, path: str, request_headers, method: str = "GET", media_type: str = None):
+        self.path = path
+        self.send_body = method != "HEAD"
+        self.start = 0
+
+        stat_result = os.stat(path)
+        size = stat_result.st_size
+        etag = file_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+        headers = {
+            "accept-ranges": "bytes",
+            "etag": etag,
+            "last-modified": last_modified,
+        }
+        media_type = media_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+        if _not_modified(request_headers, etag, stat_result.st_mtime):
+            self.length = 0
+            super().__init__(status_code=304, headers=headers)
+            return
+
+        byte_range = None
+        range_header = request_headers.get("range")
+        if_range = request_headers.get("if-range")
+        # A stale If-Range validator means the client wants the whole new file
+        if range_header and (if_range is None or if_range in (etag, last_modified)):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                self.length = 0
+                headers["content-range"] = f"bytes */{size}"
+                super().__init__(status_code=416, headers=headers)
+                return
+
+        if byte_range is None:
+            status_code = 200
+            self.length = size
+        else:
+            status_code = 206
+            self.start, end = byte_range
+            self.length = end - self.start
+            headers["content-range"] = f"bytes {self.start}-{end - 1}/{size}"
+
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.headers["content-length"] = str(self.length)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+
+        if not self.send_body or self.length == 0:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+
+        # Stop reading the file as soon as the player disconnects (e.g. on seek)
+        async with anyio.create_task_group() as task_group:
+            async def send_file():
+                if "http.response.zerocopysend" in scope.get("extensions", {}):
+                    await self._zerocopy_send(send)
+                else:
+                    await self._chunked_send(send)
+                task_group.cancel_scope.cancel()
+
+            task_group.start_soon(send_file)
+            while (await receive())["type"] != "http.disconnect":
+                pass
+            task_group.cancel_scope.cancel()
+
+    async def _zerocopy_send(self, send: Send):
+        with open(self.path, "rb") as f:
+            await send({
+                "type": "http.response.zerocopysend",
+                "file": f.fileno(),
+                "offset": self.start,
+                "count": self.length,
+                "more_body": False
+            })
+
+    async def _chunked_send(self, send: Send):
+        async with await anyio.open_file(self.path, "rb") as f:
+            await f.seek(self.start)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await f.read(min(AUDIO_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # The file shrank while it was being sent
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
@@ -0,0 +1,83 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import os
+from sqlalchemy import select, and_, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from dotenv import load_dotenv
+
+from database import ChatMessage
+
+load_dotenv()
+
+# Number of most recent messages included in the chat prompt
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "6"))
+
+
+async def load_recent_history(
+    db: AsyncSession,
+    session_id: int,
+    limit: int = CHAT_HISTORY_WINDOW
+) -> List[Dict[str, str]]:
+    """
+    Load the last messages of a chat session for the prompt
+
+    Only the tail window is read, newest first through the
+    (session_id, timestamp, id) index, then returned in chronological order.
+
+    Args:
+        db: Async database session
+        session_id: ID of the chat session
+        limit: Number of most recent messages to load
+
+    Returns:
+        List of role/content dicts, oldest first
+    """
+    messages = (await db.scalars(
+        select(ChatMessage).filter(
+            ChatMessage.session_id == session_id
+        ).order_by(
+            ChatMessage.timestamp.desc(),
+            ChatMessage.id.desc()
+        ).limit(limit)
+    )).all()
+
+    return [
+        {"role": msg.role, "content": msg.content}
+        for msg in reversed(messages)
+    ]
+
+
+def get_messages_page(
+    db: Session,
+    session_id: int,
+    limit: int,
+    after: Optional[Tuple[datetime, int]] = None
+) -> Tuple[List[ChatMessage], bool]:
+    """
+    Load one page of a chat session's messages in chronological order
+
+    Args:
+        db: Database session
+        session_id: ID of the chat session
+        limit: Maximum number of messages to return
+        after: (timestamp, id) of the last message of the previous page
+
+    Returns:
+        Tuple of (messages, whether more messages follow)
+    """
+    query = db.query(ChatMessage).filter(ChatMessage.session_id == session_id)
+
+    if after:
+        timestamp, last_id = after
+        query = query.filter(or_(
+            ChatMessage.timestamp > timestamp,
+            and_(ChatMessage.timestamp == timestamp, ChatMessage.id > last_id)
+        ))
+
+    messages = query.order_by(
+        ChatMessage.timestamp,
+        ChatMessage.id
+    ).limit(limit + 1).all()
+
+    return messages[:limit], len(messages) > limit
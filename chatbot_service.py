@@ -1,24 +1,42 @@
-from openai import OpenAI
-from typing import List, Dict
+from openai import OpenAI, AsyncOpenAI
+from typing import List, Dict, Hashable, Iterator, AsyncIterator, Callable, Optional, Union
+import logging
 import os
 from dotenv import load_dotenv
-from vector_store import VectorStore
+from vector_store import VectorStore, get_vector_store
+from response_cache import SemanticResponseCache, get_response_cache
+from chat_history import CHAT_HISTORY_WINDOW
+from prompt_builder import CHAT_MODEL, build_chat_prompt
+import summarizer
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Chunks retrieved per question; the prompt builder keeps as many as fit the token budget
+CONTEXT_CHUNKS = int(os.getenv("CONTEXT_CHUNKS", "8"))
+
+NO_CONTEXT_ANSWER = "I don't have enough information from this podcast to answer your question."
 
 
 class ChatbotService:
-    def __init__(self):
-        self.vector_store = VectorStore()
+    def __init__(self, vector_store: VectorStore = None, response_cache: SemanticResponseCache = None):
+        # Share the process-wide store so collections written at ingestion are searchable here
+        self.vector_store = vector_store if vector_store is not None else get_vector_store()
+        self.response_cache = response_cache if response_cache is not None else get_response_cache()
 
     def generate_response(
         self,
         podcast_id: int,
         user_query: str,
-        chat_history: List[Dict[str, str]] = None
-    ) -> str:
+        chat_history: List[Dict[str, str]] = None,
+        stream: bool = False,
+        sources: Optional[List[Dict]] = None,
+        transcription_version: Hashable = None
+    ) -> Union[str, Iterator[str]]:
         """
         Generate a chatbot response based on the podcast transcription
 
@@ -26,52 +44,271 @@ class ChatbotService:
             podcast_id: ID of the podcast
             user_query: User's question
             chat_history: Previous chat messages
+            stream: Yield the response in pieces as the model produces them
+            sources: List filled with the text, start and end time of retrieved
+                excerpts that have timestamps
+            transcription_version: Version of the podcast's transcription (e.g. its
+                created_at); cached answers are only reused for the same version
 
         Returns:
-            Generated response
+            Generated response, or an iterator of response text pieces when streaming
         """
+        # Answers to standalone questions can be reused for similar questions
+        query_embedding = None
+        use_cache = self._use_cache(chat_history)
+        if use_cache:
+            query_embedding = self._try_embed(user_query)
+            use_cache = query_embedding is not None
+        if use_cache:
+            cached = self.response_cache.lookup(podcast_id, query_embedding, transcription_version)
+            if cached is not None:
+                cached_answer, cached_sources = cached
+                if sources is not None:
+                    sources.extend(cached_sources)
+                return iter([cached_answer]) if stream else cached_answer
+
         # Search for relevant context from transcription
-        relevant_chunks = self.vector_store.search(podcast_id, user_query, n_results=5)
+        relevant_chunks = self.vector_store.search(
+            podcast_id, user_query, n_results=CONTEXT_CHUNKS, query_embedding=query_embedding
+        )
+        timed_sources = self._timed_sources(relevant_chunks)
+        if sources is not None:
+            sources.extend(timed_sources)
 
         if not relevant_chunks:
-            return "I don't have enough information from this podcast to answer your question."
+            return iter([NO_CONTEXT_ANSWER]) if stream else NO_CONTEXT_ANSWER
 
-        # Build context from relevant chunks
-        context = "\n\n".join([chunk['text'] for chunk in relevant_chunks])
+        messages = self._build_messages(relevant_chunks, user_query, chat_history)
+        on_complete = None
+        if use_cache:
+            on_complete = self._cache_callback(
+                podcast_id, user_query, query_embedding, timed_sources, transcription_version
+            )
 
-        # Build messages for the chat
-        messages = [
-            {
-                "role": "system",
-                "content": f"""You are a helpful AI assistant that answers questions about podcast content.
-You have access to the following transcription excerpts from the podcast:
+        if stream:
+            return self._stream_completion(messages, on_complete)
 
-{context}
+        # Generate response
+        try:
+            response = client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500
+            )
+            answer = response.choices[0].message.content
+        except Exception as e:
+            return f"Error generating response: {str(e)}"
 
-Answer the user's questions based on this content. If the answer is not in the provided excerpts,
-say so. Be conversational and helpful. Cite specific parts of the transcription when relevant."""
-            }
-        ]
+        if on_complete:
+            on_complete(answer)
+        return answer
 
-        # Add chat history
-        if chat_history:
-            messages.extend(chat_history[-6:])  # Include last 6 messages for context
+    async def agenerate_response(
+        self,
+        podcast_id: int,
+        user_query: str,
+        chat_history: List[Dict[str, str]] = None,
+        stream: bool = False,
+        sources: Optional[List[Dict]] = None,
+        transcription_version: Hashable = None
+    ) -> Union[str, AsyncIterator[str]]:
+        """
+        Async variant of generate_response that does not hold a worker thread
+        while waiting on the embeddings and chat completion APIs
 
-        # Add current user query
-        messages.append({"role": "user", "content": user_query})
+        Args:
+            podcast_id: ID of the podcast
+            user_query: User's question
+            chat_history: Previous chat messages
+            stream: Yield the response in pieces as the model produces them
+            sources: List filled with the text, start and end time of retrieved
+                excerpts that have timestamps
+            transcription_version: Version of the podcast's transcription (e.g. its
+                created_at); cached answers are only reused for the same version
+
+        Returns:
+            Generated response, or an async iterator of response text pieces when streaming
+        """
+        query_embedding = None
+        use_cache = self._use_cache(chat_history)
+        if use_cache:
+            query_embedding = await self._atry_embed(user_query)
+            use_cache = query_embedding is not None
+        if use_cache:
+            cached = self.response_cache.lookup(podcast_id, query_embedding, transcription_version)
+            if cached is not None:
+                cached_answer, cached_sources = cached
+                if sources is not None:
+                    sources.extend(cached_sources)
+                return self._aiter_text(cached_answer) if stream else cached_answer
+
+        relevant_chunks = await self.vector_store.asearch(
+            podcast_id, user_query, n_results=CONTEXT_CHUNKS, query_embedding=query_embedding
+        )
+        timed_sources = self._timed_sources(relevant_chunks)
+        if sources is not None:
+            sources.extend(timed_sources)
+
+        if not relevant_chunks:
+            if stream:
+                return self._aiter_text(NO_CONTEXT_ANSWER)
+            return NO_CONTEXT_ANSWER
+
+        messages = self._build_messages(relevant_chunks, user_query, chat_history)
+        on_complete = None
+        if use_cache:
+            on_complete = self._cache_callback(
+                podcast_id, user_query, query_embedding, timed_sources, transcription_version
+            )
+
+        if stream:
+            return self._astream_completion(messages, on_complete)
 
-        # Generate response
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
+            response = await async_client.chat.completions.create(
+                model=CHAT_MODEL,
                 messages=messages,
                 temperature=0.7,
                 max_tokens=500
             )
-            return response.choices[0].message.content
+            answer = response.choices[0].message.content
         except Exception as e:
             return f"Error generating response: {str(e)}"
 
+        if on_complete:
+            on_complete(answer)
+        return answer
+
+    @staticmethod
+    def _timed_sources(relevant_chunks: List[Dict]) -> List[Dict]:
+        """Time ranges of the retrieved chunks, for seeking to them in the audio"""
+        return [
+            {"text": chunk['text'], "start": chunk['start'], "end": chunk['end']}
+            for chunk in relevant_chunks
+            if chunk.get('start') is not None
+        ]
+
+    def _use_cache(self, chat_history: List[Dict[str, str]] = None) -> bool:
+        """
+        Whether the answer cache applies to a question
+
+        Only standalone questions are cached, and not in lexical search mode,
+        which makes no embedding calls.
+        """
+        return (
+            self.response_cache is not None
+            and not chat_history
+            and self.vector_store.search_mode != "lexical"
+        )
+
+    def _try_embed(self, user_query: str):
+        """Embed the question for the answer cache, or return None if embeddings are unavailable"""
+        try:
+            return self.vector_store.embed_query(user_query)
+        except Exception as e:
+            logger.warning("Query embedding failed, skipping the answer cache: %s", e)
+            return None
+
+    async def _atry_embed(self, user_query: str):
+        """Async variant of _try_embed"""
+        try:
+            return await self.vector_store.aembed_query(user_query)
+        except Exception as e:
+            logger.warning("Query embedding failed, skipping the answer cache: %s", e)
+            return None
+
+    def _cache_callback(
+        self,
+        podcast_id: int,
+        user_query: str,
+        query_embedding: List[float],
+        sources: List[Dict],
+        transcription_version: Hashable = None
+    ) -> Callable[[str], None]:
+        """Return a callback that stores a successfully generated answer and its sources in the response cache"""
+        def store(answer: str):
+            self.response_cache.store(
+                podcast_id, query_embedding, user_query, answer,
+                sources=sources, version=transcription_version
+            )
+        return store
+
+    @staticmethod
+    async def _aiter_text(text: str) -> AsyncIterator[str]:
+        yield text
+
+    async def _astream_completion(
+        self,
+        messages: List[Dict[str, str]],
+        on_complete: Optional[Callable[[str], None]] = None
+    ) -> AsyncIterator[str]:
+        """Yield response text pieces from an async streaming chat completion"""
+        pieces = []
+        try:
+            response = await async_client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                stream=True
+            )
+            async for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            yield f"Error generating response: {str(e)}"
+            return
+
+        if on_complete:
+            on_complete("".join(pieces))
+
+    def _stream_completion(
+        self,
+        messages: List[Dict[str, str]],
+        on_complete: Optional[Callable[[str], None]] = None
+    ) -> Iterator[str]:
+        """Yield response text pieces from a streaming chat completion"""
+        pieces = []
+        try:
+            response = client.chat.completions.create(
+                model=CHAT_MODEL,
+                messages=messages,
+                temperature=0.7,
+                max_tokens=500,
+                stream=True
+            )
+            for chunk in response:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    pieces.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        except Exception as e:
+            yield f"Error generating response: {str(e)}"
+            return
+
+        if on_complete:
+            on_complete("".join(pieces))
+
+    def _build_messages(
+        self,
+        relevant_chunks: List[Dict],
+        user_query: str,
+        chat_history: List[Dict[str, str]] = None
+    ) -> List[Dict[str, str]]:
+        """Build the chat prompt from retrieved chunks and recent history within the token budget"""
+        history = chat_history[-CHAT_HISTORY_WINDOW:] if chat_history else None
+        prompt = build_chat_prompt(
+            [chunk['text'] for chunk in relevant_chunks],
+            user_query,
+            history
+        )
+        logger.info(
+            "Prompt: %d tokens (%d/%d chunks, %d history messages)",
+            prompt.prompt_tokens, prompt.context_chunks, len(relevant_chunks), prompt.history_messages
+        )
+        return prompt.messages
+
     def summarize_transcription(self, transcription_text: str) -> str:
         """
         Generate a summary of the podcast transcription
@@ -83,21 +320,6 @@ say so. Be conversational and helpful. Cite specific parts of the transcription
             Summary text
         """
         try:
-            response = client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a helpful assistant that summarizes podcast transcriptions."
-                    },
-                    {
-                        "role": "user",
-                        "content": f"Please provide a concise summary of this podcast transcription:\n\n{transcription_text[:4000]}"
-                    }
-                ],
-                temperature=0.5,
-                max_tokens=300
-            )
-            return response.choices[0].message.content
+            return summarizer.summarize_transcription(transcription_text)
         except Exception as e:
             return f"Error generating summary: {str(e)}"
@@ -1,16 +1,61 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey
+from sqlalchemy import create_engine, inspect, text, Column, Integer, Float, String, Text, DateTime, ForeignKey, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from db_config import engine_options, configure_engine
 
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./podcast_chatbot.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+def normalize_url(url: str) -> str:
+    """Accept the short postgres:// scheme (used by Heroku and others), which SQLAlchemy rejects"""
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+DATABASE_URL = normalize_url(os.getenv("DATABASE_URL", "sqlite:///./podcast_chatbot.db"))
+
+# Async driver used for each database backend
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def to_async_url(url: str) -> str:
+    """
+    Map a sync database URL to the matching async driver URL
+
+    The driver is replaced whatever it was, so sqlite://, postgresql://,
+    postgresql+psycopg2:// and postgres:// all work.
+
+    Raises:
+        ValueError: If no async driver is known for the backend
+    """
+    parsed = make_url(normalize_url(url))
+    driver = ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise ValueError(
+            f"No async driver known for {parsed.drivername}://; set ASYNC_DATABASE_URL to an async URL for this database"
+        )
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL))
+configure_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine used by request handlers that wait on the network (chat)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **engine_options(ASYNC_DATABASE_URL))
+configure_engine(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False, autoflush=False)
 Base = declarative_base()
 
 
@@ -23,6 +68,15 @@ class Podcast(Base):
     file_path = Column(String, nullable=False)
     upload_date = Column(DateTime, default=datetime.utcnow)
     transcription_status = Column(String, default="pending")  # pending, processing, completed, failed
+    content_hash = Column(String, unique=True, index=True)  # sha256 of the audio file
+
+    __table_args__ = (
+        # Newest-first listing and keyset pagination, optionally filtered by status
+        Index("ix_podcasts_upload_date_id", "upload_date", "id"),
+        Index("ix_podcasts_status_upload_date_id", "transcription_status", "upload_date", "id"),
+        # Title prefix search
+        Index("ix_podcasts_title", "title"),
+    )
 
     transcription = relationship("Transcription", back_populates="podcast", uselist=False)
     chat_sessions = relationship("ChatSession", back_populates="podcast")
@@ -36,8 +90,33 @@ class Transcription(Base):
     full_text = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     duration = Column(Integer)  # in seconds
+    summary = Column(Text)
+    summary_created_at = Column(DateTime)
 
     podcast = relationship("Podcast", back_populates="transcription")
+    segments = relationship(
+        "TranscriptSegment",
+        back_populates="transcription",
+        order_by="TranscriptSegment.position",
+        cascade="all, delete-orphan"
+    )
+
+
+class TranscriptSegment(Base):
+    __tablename__ = "transcript_segments"
+
+    id = Column(Integer, primary_key=True, index=True)
+    transcription_id = Column(Integer, ForeignKey("transcriptions.id"), nullable=False)
+    position = Column(Integer, nullable=False)  # order within the transcription
+    start = Column(Float, nullable=False)  # seconds from the start of the audio
+    end = Column(Float, nullable=False)
+    text = Column(Text, nullable=False)
+
+    __table_args__ = (
+        Index("ix_transcript_segments_transcription_position", "transcription_id", "position"),
+    )
+
+    transcription = relationship("Transcription", back_populates="segments")
 
 
 class ChatSession(Base):
@@ -62,10 +141,66 @@ class ChatMessage(Base):
 
     session = relationship("ChatSession", back_populates="messages")
 
+    __table_args__ = (
+        # Loading a session's messages in order, and its most recent messages
+        Index("ix_chat_messages_session_timestamp_id", "session_id", "timestamp", "id"),
+    )
+
+
+class SectionSummary(Base):
+    __tablename__ = "section_summaries"
+
+    # sha256 of the summarization model, prompt and section text
+    text_hash = Column(String, primary_key=True)
+    summary = Column(Text, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class TranscriptionJob(Base):
+    __tablename__ = "transcription_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    podcast_id = Column(Integer, ForeignKey("podcasts.id"), index=True)
+    file_path = Column(String, nullable=False)
+    status = Column(String, default="queued", index=True)  # queued, running, completed, failed
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=3)
+    next_run_at = Column(DateTime, default=datetime.utcnow)
+    locked_at = Column(DateTime)
+    worker_id = Column(String)  # host:pid:token of the process running the job
+    heartbeat_at = Column(DateTime)  # refreshed while the job runs
+    last_error = Column(Text)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+def upgrade_schema():
+    """
+    Bring tables created by an older version up to date
+
+    create_all only creates missing tables, so new nullable columns are
+    added with ALTER TABLE and missing indexes are created here.
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 
 def init_db():
     """Initialize the database tables"""
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
 
 
 def get_db():
@@ -75,3 +210,9 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+async def get_async_db():
+    """Dependency for getting an async database session"""
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,73 @@
+from typing import Dict
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import Engine, make_url
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# SQLite journal mode; WAL lets readers proceed while the transcription worker writes
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+# SQLite fsync level; NORMAL is durable across application crashes in WAL mode
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+# Milliseconds a SQLite connection waits for a lock before failing with "database is locked"
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", "5000"))
+
+# Connections kept open per engine for server databases (PostgreSQL, MySQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+# Extra connections allowed above the pool size under load
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Seconds to wait for a free connection before raising
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Seconds after which a connection is replaced, ahead of server-side idle timeouts
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Test connections before use so dropped ones are replaced instead of failing a request
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+
+def is_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+
+def engine_options(url: str) -> Dict:
+    """
+    Keyword arguments for create_engine / create_async_engine for a database URL
+
+    SQLite connections may be used from worker threads; server databases get
+    a sized connection pool with pre-ping and recycling.
+    """
+    if is_sqlite(url):
+        if make_url(url).get_driver_name() == "pysqlite":
+            return {"connect_args": {"check_same_thread": False}}
+        return {}
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def configure_engine(engine: Engine):
+    """
+    Apply per-connection settings to an engine
+
+    For SQLite, every new connection sets the busy timeout, journal mode and
+    synchronous level. Pass async_engine.sync_engine for async engines.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}")
+            if SQLITE_JOURNAL_MODE:
+                cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+            if SQLITE_SYNCHRONOUS:
+                cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        finally:
+            cursor.close()
@@ -0,0 +1,135 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# SQLite file for cached embeddings; set to an empty string to disable the cache
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.db")
+# Maximum number of cached vectors before least recently used ones are evicted
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "100000"))
+# Share of max_entries kept after an eviction, so evictions (and recounts) happen in batches
+EMBEDDING_CACHE_EVICT_TO = 0.9
+
+
+def text_hash(text: str) -> str:
+    """Return the sha256 hex digest of a chunk of text"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache stored in SQLite
+
+    Vectors are keyed by (embedding model, sha256 of the text) and stored as
+    float32 blobs. When the cache grows past max_entries the least recently
+    used vectors are evicted down to 90% of it. The entry count is tracked
+    in memory as an upper bound and only recounted when it passes the limit.
+    """
+
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.max_entries = max(1, max_entries)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS ix_embeddings_last_used ON embeddings (last_used)"
+        )
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: List[str]) -> Dict[str, List[float]]:
+        """
+        Look up cached embeddings
+
+        Args:
+            model: Embedding model name
+            texts: Texts to look up
+
+        Returns:
+            Dict mapping text hash to vector for every cache hit
+        """
+        hashes = list({text_hash(text) for text in texts})
+        found = {}
+        if not hashes:
+            return found
+
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(hashes), 500):
+                batch = hashes[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = array("f", blob).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for key in found]
+                )
+                self._conn.commit()
+
+        return found
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]):
+        """
+        Store embeddings and evict least recently used entries over the limit
+
+        Args:
+            model: Embedding model name
+            texts: Embedded texts
+            vectors: Embedding for each text
+        """
+        now = time.time()
+        rows = [
+            (model, text_hash(text), array("f", vector).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        if not rows:
+            return
+
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            # Replaced rows do not add entries, so this may overestimate
+            self._count += len(rows)
+            if self._count > self.max_entries:
+                self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+                if self._count > self.max_entries:
+                    keep = int(self.max_entries * EMBEDDING_CACHE_EVICT_TO)
+                    self._conn.execute(
+                        "DELETE FROM embeddings WHERE rowid IN "
+                        "(SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+                        (self._count - keep,)
+                    )
+                    self._count = keep
+            self._conn.commit()
+
+
+def create_embedding_cache(path: str = EMBEDDING_CACHE_PATH) -> Optional[EmbeddingCache]:
+    """Create the embedding cache, or return None when it is disabled"""
+    if not path:
+        return None
+    return EmbeddingCache(path)
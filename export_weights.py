@@ -0,0 +1,163 @@
+"""
+Export GPT weights to a memory-mappable file and load GPT straight from it
+
+The file uses the safetensors layout: an 8-byte little-endian header size,
+a JSON header with dtype, shape and byte offsets per tensor (plus
+model_args under __metadata__), then the raw tensor bytes. Only model
+weights are written, never optimizer state.
+
+Loading maps the file copy-on-write and wraps each tensor around the mapped
+bytes, and GPT is built on the meta device so no weights are allocated or
+initialized first. Pages are read lazily and shared between worker processes
+through the page cache.
+
+Usage:
+    python export_weights.py --checkpoint model_output/ckpt.pt --out model_output/model.safetensors
+"""
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import torch
+
+from new_model import GPTConfig, GPT
+
+DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+DTYPE_NAMES = {dtype: name for name, dtype in DTYPES.items()}
+
+# Prefix added to parameter names by torch.compile during training
+COMPILED_PREFIX = '_orig_mod.'
+
+
+def export_weights(checkpoint_path: str, out_path: str, dtype: torch.dtype = None):
+    """
+    Write the weights and model_args of a training checkpoint to out_path
+
+    Tensors that share storage (the tied wte / lm_head weight) are written
+    once and recorded as aliases.
+
+    Args:
+        checkpoint_path: Checkpoint with 'model' and 'model_args' keys
+        out_path: File to write
+        dtype: Optional floating point dtype to convert the weights to
+    """
+    checkpoint = torch.load(checkpoint_path, map_location='cpu')
+    state_dict = {
+        name[len(COMPILED_PREFIX):] if name.startswith(COMPILED_PREFIX) else name: tensor
+        for name, tensor in checkpoint['model'].items()
+    }
+
+    tensors, aliases, seen = {}, {}, {}
+    for name, tensor in state_dict.items():
+        key = (tensor.data_ptr(), tensor.dtype, tuple(tensor.shape))
+        if key in seen:
+            aliases[name] = seen[key]
+            continue
+        seen[key] = name
+        if dtype is not None and tensor.is_floating_point():
+            tensor = tensor.to(dtype)
+        tensors[name] = tensor.contiguous()
+
+    # largest elements first keeps every tensor aligned to its element size
+    order = sorted(tensors, key=lambda name: -tensors[name].element_size())
+    header = {"__metadata__": {"model_args": json.dumps(checkpoint['model_args']), "aliases": json.dumps(aliases)}}
+    offset = 0
+    for name in order:
+        tensor = tensors[name]
+        size = tensor.numel() * tensor.element_size()
+        header[name] = {
+            "dtype": DTYPE_NAMES[tensor.dtype],
+            "shape": list(tensor.shape),
+            "data_offsets": [offset, offset + size],
+        }
+        offset += size
+
+    header_bytes = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    # pad the header so the data starts 8-byte aligned
+    header_bytes += b' ' * (-len(header_bytes) % 8)
+
+    with open(out_path, 'wb') as f:
+        f.write(struct.pack('<Q', len(header_bytes)))
+        f.write(header_bytes)
+        for name in order:
+            if tensors[name].numel():
+                f.write(memoryview(tensors[name].reshape(-1).view(torch.uint8).numpy()))
+
+
+def load_weights(path: str):
+    """
+    Map a weights file into memory
+
+    Returns:
+        (state_dict of tensors backed by the mapped file, model_args)
+    """
+    with open(path, 'rb') as f:
+        # ACCESS_COPY: writable for torch, but nothing is copied or written back unless modified
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    header_size = struct.unpack('<Q', buffer[:8])[0]
+    header = json.loads(buffer[8:8 + header_size])
+    metadata = header.pop("__metadata__", {})
+    data_start = 8 + header_size
+
+    state_dict = {}
+    for name, info in header.items():
+        dtype = DTYPES[info["dtype"]]
+        begin, end = info["data_offsets"]
+        if end == begin:
+            state_dict[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        itemsize = torch.empty((), dtype=dtype).element_size()
+        state_dict[name] = torch.frombuffer(
+            buffer, dtype=dtype, count=(end - begin) // itemsize, offset=data_start + begin
+        ).view(info["shape"])
+
+    for name, target in json.loads(metadata.get("aliases", "{}")).items():
+        state_dict[name] = state_dict[target]
+
+    return state_dict, json.loads(metadata["model_args"])
+
+
+def load_model_mmap(path: str) -> GPT:
+    """Build GPT for CPU inference directly on the memory-mapped weights of an exported file"""
+    state_dict, model_args = load_weights(path)
+
+    # parameters on the meta device take no memory and skip the random init
+    with torch.device('meta'):
+        model = GPT(GPTConfig(**model_args))
+    model.load_state_dict(state_dict, assign=True)
+    # assign gives each name its own Parameter; restore the weight tying
+    model.transformer.wte.weight = model.lm_head.weight
+
+    missing = [name for name, tensor in model.state_dict().items() if tensor.is_meta]
+    assert not missing, f"{path} has no data for {missing}"
+    model.eval()
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default=os.path.join('model_output', 'ckpt.pt'))
+    parser.add_argument('--out', default=os.path.join('model_output', 'model.safetensors'))
+    parser.add_argument('--dtype', choices=['float32', 'float16', 'bfloat16'], help="convert weights to this dtype")
+    args = parser.parse_args()
+
+    export_weights(args.checkpoint, args.out, getattr(torch, args.dtype) if args.dtype else None)
+    print(f"Exported {args.checkpoint} to {args.out} ({os.path.getsize(args.out) / 1e6:.1f}MB)")
+
+
+if __name__ == '__main__':
+    main()
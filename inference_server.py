@@ -0,0 +1,250 @@
+"""
+HTTP inference server for the GPT model in new_model.py
+
+Loads a checkpoint once and serves completions. Requests that arrive within
+a short window are generated together as one batch, and every request gets
+its tokens streamed back as they are sampled.
+
+Run with: python inference_server.py
+"""
+import asyncio
+import json
+import os
+import pickle
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import torch
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
+from dotenv import load_dotenv
+
+from new_model import GPTConfig, GPT
+from quantize_model import QUANTIZATION, quantize
+from export_weights import load_model_mmap
+
+load_dotenv()
+
+# Checkpoint written by training (model weights and model_args), by quantize_model.py,
+# or a memory-mapped .safetensors file written by export_weights.py
+CHECKPOINT_PATH = os.getenv("CHECKPOINT_PATH", os.path.join("model_output", "ckpt.pt"))
+# Character vocabulary (stoi/itos) written by data preparation
+META_PATH = os.getenv("META_PATH", os.path.join("data", "meta.pkl"))
+INFERENCE_DEVICE = os.getenv("INFERENCE_DEVICE", "cpu")
+# Milliseconds to wait for more requests after the first one before starting a batch
+BATCH_WINDOW_MS = float(os.getenv("BATCH_WINDOW_MS", "10"))
+# Most requests generated together in one batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "16"))
+INFERENCE_HOST = os.getenv("INFERENCE_HOST", "127.0.0.1")
+INFERENCE_PORT = int(os.getenv("INFERENCE_PORT", "8100"))
+
+
+def load_model(checkpoint_path: str = CHECKPOINT_PATH, device: str = INFERENCE_DEVICE) -> GPT:
+    """Build GPT from a training, int8 quantized or exported checkpoint, ready for inference"""
+    if checkpoint_path.endswith('.safetensors'):
+        return load_model_mmap(checkpoint_path).to(device)
+
+    checkpoint = torch.load(checkpoint_path, map_location=device)
+    model = GPT(GPTConfig(**checkpoint['model_args']))
+    if checkpoint.get('quantization') == QUANTIZATION:
+        # dynamically quantized layers only run on the CPU
+        assert device == 'cpu', "int8 checkpoints need INFERENCE_DEVICE=cpu"
+        model = quantize(model)
+    model.load_state_dict(checkpoint['model'])
+    model.eval()
+    model.to(device)
+    return model
+
+
+def load_vocab(meta_path: str = META_PATH):
+    """Return the (stoi, itos) character mappings"""
+    with open(meta_path, 'rb') as f:
+        meta = pickle.load(f)
+    return meta['stoi'], meta['itos']
+
+
+@dataclass
+class GenerationRequest:
+    prompt: List[int]
+    max_new_tokens: int
+    temperature: float
+    top_k: Optional[int]
+    loop: asyncio.AbstractEventLoop
+    # receives sampled tokens, then None when generation has finished, or an Exception
+    tokens: asyncio.Queue = field(default_factory=asyncio.Queue)
+    cancelled: bool = False
+
+    def put(self, item):
+        self.loop.call_soon_threadsafe(self.tokens.put_nowait, item)
+
+
+class BatchScheduler:
+    """
+    Collects generation requests into micro-batches and runs them on one thread
+
+    The first waiting request opens a window of window_ms; requests that arrive
+    before it closes (up to max_batch_size) join the batch. Requests with the
+    same sampling settings are generated together with GPT.generate_stream.
+    """
+
+    def __init__(self, model: GPT, max_batch_size: int = MAX_BATCH_SIZE, window_ms: float = BATCH_WINDOW_MS):
+        self.model = model
+        self.max_batch_size = max(1, max_batch_size)
+        self.window = window_ms / 1000
+        self._pending = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, request: GenerationRequest):
+        self._pending.put(request)
+
+    def _collect(self) -> List[GenerationRequest]:
+        batch = [self._pending.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = [request for request in self._collect() if not request.cancelled]
+
+            groups = {}
+            for request in batch:
+                groups.setdefault((request.temperature, request.top_k), []).append(request)
+
+            for (temperature, top_k), group in groups.items():
+                self._generate(group, temperature, top_k)
+
+    def _generate(self, group: List[GenerationRequest], temperature: float, top_k: Optional[int]):
+        try:
+            steps = self.model.generate_stream(
+                [request.prompt for request in group],
+                [request.max_new_tokens for request in group],
+                temperature=temperature,
+                top_k=top_k
+            )
+            for step in steps:
+                for request, token in zip(group, step):
+                    if token is not None and not request.cancelled:
+                        request.put(token)
+                # stop early when every client has gone away
+                if all(request.cancelled for request in group):
+                    break
+        except Exception as e:
+            print(f"Generation failed for a batch of {len(group)}: {str(e)}")
+            for request in group:
+                request.put(e)
+            return
+
+        for request in group:
+            request.put(None)
+
+
+class CompletionRequest(BaseModel):
+    prompt: str = Field(..., min_length=1)
+    max_new_tokens: int = Field(100, ge=1, le=2000)
+    temperature: float = Field(0.8, gt=0)
+    top_k: Optional[int] = Field(200, ge=1)
+    stream: bool = True
+
+
+class CompletionResponse(BaseModel):
+    text: str
+
+
+app = FastAPI(title="GPT Inference Server")
+
+scheduler: Optional[BatchScheduler] = None
+stoi, itos = {}, {}
+
+
+@app.on_event("startup")
+def start_scheduler():
+    global scheduler, stoi, itos
+    stoi, itos = load_vocab()
+    scheduler = BatchScheduler(load_model())
+    print(f"Loaded {CHECKPOINT_PATH} on {INFERENCE_DEVICE}")
+
+
+def sse_event(event: str, data: dict) -> str:
+    """Format a Server-Sent Events message"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def iter_tokens(request: GenerationRequest):
+    """Yield the tokens of a submitted request, raising if generation failed"""
+    while True:
+        item = await request.tokens.get()
+        if item is None:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield item
+
+
+@app.post("/generate", response_model=CompletionResponse)
+async def generate(body: CompletionRequest):
+    """
+    Complete a prompt
+
+    With stream=true (the default) the answer is sent as Server-Sent Events:
+    "token" events with each generated piece of text and a final "done"
+    event. Otherwise the whole completion is returned at once.
+    """
+    unknown = sorted(set(body.prompt) - set(stoi))
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Characters not in the vocabulary: {''.join(unknown)!r}")
+
+    request = GenerationRequest(
+        prompt=[stoi[c] for c in body.prompt],
+        max_new_tokens=body.max_new_tokens,
+        temperature=body.temperature,
+        top_k=body.top_k,
+        loop=asyncio.get_running_loop()
+    )
+    scheduler.submit(request)
+
+    if not body.stream:
+        try:
+            text = "".join([itos[token] async for token in iter_tokens(request)])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Generation failed: {str(e)}")
+        return CompletionResponse(text=text)
+
+    async def event_stream():
+        try:
+            async for token in iter_tokens(request):
+                yield sse_event("token", {"delta": itos[token]})
+            yield sse_event("done", {})
+        except Exception as e:
+            yield sse_event("error", {"detail": str(e)})
+        finally:
+            # client disconnected or stream finished; stop generating for it
+            request.cancelled = True
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok" if scheduler is not None else "loading", "device": INFERENCE_DEVICE}
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=INFERENCE_HOST, port=INFERENCE_PORT)
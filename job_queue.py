@@ -0,0 +1,343 @@
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+import os
+from dotenv import load_dotenv
+
+from database import SessionLocal, Podcast, Transcription, TranscriptSegment, TranscriptionJob
+from transcription_service import transcribe_audio
+from vector_store import get_vector_store
+
+load_dotenv()
+
+# Number of transcription jobs processed in parallel
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "2"))
+# Attempts per job before the podcast is marked as failed
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# Base delay in seconds for exponential retry backoff
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "30"))
+# Seconds between queue polls when idle
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+# Seconds between heartbeats of running jobs and sweeps for abandoned ones
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+# Running jobs without a heartbeat for this many seconds are treated as abandoned
+JOB_STALE_AFTER = int(os.getenv("JOB_STALE_AFTER", "60"))
+
+# Identifies the jobs claimed by this process; the random token tells it apart from an
+# earlier process with the same host and PID (e.g. PID 1 of a container restarted in place)
+HOSTNAME = socket.gethostname()
+WORKER_ID = f"{HOSTNAME}:{os.getpid()}:{uuid.uuid4().hex}"
+
+# Set when a job is enqueued so in-process workers wake up without waiting for the next poll
+_job_available = threading.Event()
+
+
+def enqueue_transcription(db, podcast_id: int, file_path: str) -> TranscriptionJob:
+    """
+    Add a transcription job to the queue
+
+    Args:
+        db: Database session
+        podcast_id: ID of the podcast to transcribe
+        file_path: Path to the uploaded audio file
+
+    Returns:
+        The queued job
+    """
+    job = TranscriptionJob(
+        podcast_id=podcast_id,
+        file_path=file_path,
+        status="queued",
+        max_attempts=JOB_MAX_ATTEMPTS
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    _job_available.set()
+    return job
+
+
+def claim_job(db) -> Optional[TranscriptionJob]:
+    """
+    Claim the oldest runnable job
+
+    The claim is a conditional UPDATE on status, so two workers (or two
+    processes) never run the same job.
+
+    Returns:
+        The claimed job, or None if nothing is runnable
+    """
+    now = datetime.utcnow()
+    candidates = db.query(TranscriptionJob.id).filter(
+        TranscriptionJob.status == "queued",
+        TranscriptionJob.next_run_at <= now
+    ).order_by(TranscriptionJob.id).limit(5).all()
+
+    for (job_id,) in candidates:
+        claimed = db.query(TranscriptionJob).filter(
+            TranscriptionJob.id == job_id,
+            TranscriptionJob.status == "queued"
+        ).update({
+            TranscriptionJob.status: "running",
+            TranscriptionJob.locked_at: now,
+            TranscriptionJob.worker_id: WORKER_ID,
+            TranscriptionJob.heartbeat_at: now,
+            TranscriptionJob.attempts: TranscriptionJob.attempts + 1
+        }, synchronize_session=False)
+        db.commit()
+        if claimed:
+            return db.query(TranscriptionJob).filter(TranscriptionJob.id == job_id).first()
+
+    return None
+
+
+def process_transcription(db, podcast_id: int, file_path: str):
+    """
+    Transcribe a podcast and index it in the vector store
+
+    Raises on failure so the caller can retry the job.
+    """
+    podcast = db.query(Podcast).filter(Podcast.id == podcast_id).first()
+
+    # Update status to processing
+    podcast.transcription_status = "processing"
+    db.commit()
+
+    # Transcribe audio
+    result = transcribe_audio(file_path)
+
+    # Save transcription, replacing one left over from an earlier attempt
+    transcription = db.query(Transcription).filter(
+        Transcription.podcast_id == podcast_id
+    ).first()
+    if transcription is None:
+        transcription = Transcription(podcast_id=podcast_id)
+        db.add(transcription)
+    transcription.full_text = result["text"]
+    # Also the version of the transcript: cached answers about an older one are not reused
+    transcription.created_at = datetime.utcnow()
+    transcription.duration = result.get("duration")
+    transcription.summary = None
+    transcription.summary_created_at = None
+    segments = result.get("segments") or []
+    transcription.segments = [
+        TranscriptSegment(position=i, start=segment["start"], end=segment["end"], text=segment["text"])
+        for i, segment in enumerate(segments)
+    ]
+
+    # Create vector store
+    get_vector_store().create_collection_for_podcast(podcast_id, result["text"], segments)
+
+    # Update status to completed
+    podcast.transcription_status = "completed"
+    db.commit()
+
+
+def run_job(db, job: TranscriptionJob):
+    """Run a claimed job and record success, a scheduled retry or final failure"""
+    podcast = db.query(Podcast).filter(Podcast.id == job.podcast_id).first()
+    if podcast is None:
+        # Podcast was deleted while the job was queued
+        job.status = "failed"
+        job.last_error = "Podcast no longer exists"
+        db.commit()
+        return
+
+    try:
+        process_transcription(db, job.podcast_id, job.file_path)
+        job.status = "completed"
+        job.last_error = None
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        job = db.query(TranscriptionJob).filter(TranscriptionJob.id == job.id).first()
+        podcast = db.query(Podcast).filter(Podcast.id == job.podcast_id).first()
+        job.last_error = str(e)
+
+        if job.attempts < job.max_attempts:
+            delay = JOB_RETRY_BASE_DELAY * (2 ** (job.attempts - 1))
+            job.status = "queued"
+            job.next_run_at = datetime.utcnow() + timedelta(seconds=delay)
+            print(f"Transcription of podcast {job.podcast_id} failed (attempt {job.attempts}), retrying in {delay:.0f}s: {str(e)}")
+        else:
+            job.status = "failed"
+            if podcast is not None:
+                podcast.transcription_status = "failed"
+            print(f"Transcription failed: {str(e)}")
+        db.commit()
+
+
+def _owner_gone(worker_id: Optional[str]) -> bool:
+    """Whether the process that claimed a job is known to have exited"""
+    if not worker_id or worker_id == WORKER_ID:
+        return False
+    host, _, rest = worker_id.partition(":")
+    pid = rest.partition(":")[0]
+    if host != HOSTNAME or not pid.isdigit():
+        # other hosts are only judged by their heartbeats
+        return False
+    if int(pid) == os.getpid():
+        # an earlier process that had this PID
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+def heartbeat(db) -> int:
+    """
+    Mark the jobs this process is running as alive
+
+    Returns:
+        Number of running jobs owned by this process
+    """
+    running = db.query(TranscriptionJob).filter(
+        TranscriptionJob.status == "running",
+        TranscriptionJob.worker_id == WORKER_ID
+    ).update({TranscriptionJob.heartbeat_at: datetime.utcnow()}, synchronize_session=False)
+    db.commit()
+    return running
+
+
+def recover_jobs():
+    """
+    Requeue work interrupted by a restart or a crashed worker process
+
+    Running jobs whose process has exited (same host) or whose heartbeat is
+    older than JOB_STALE_AFTER are requeued, and podcasts stuck in
+    pending/processing without an active job get one.
+    """
+    db = SessionLocal()
+
+    try:
+        now = datetime.utcnow()
+        stale_before = now - timedelta(seconds=JOB_STALE_AFTER)
+        running = db.query(TranscriptionJob.id, TranscriptionJob.worker_id, TranscriptionJob.heartbeat_at,
+                           TranscriptionJob.locked_at).filter(TranscriptionJob.status == "running").all()
+        abandoned = [
+            job_id for job_id, worker_id, heartbeat_at, locked_at in running
+            if _owner_gone(worker_id) or (heartbeat_at or locked_at or datetime.min) < stale_before
+        ]
+
+        requeued = 0
+        if abandoned:
+            requeued = db.query(TranscriptionJob).filter(
+                TranscriptionJob.id.in_(abandoned),
+                TranscriptionJob.status == "running"
+            ).update({
+                TranscriptionJob.status: "queued",
+                TranscriptionJob.worker_id: None,
+                TranscriptionJob.next_run_at: now
+            }, synchronize_session=False)
+            db.commit()
+
+        active_podcast_ids = db.query(TranscriptionJob.podcast_id).filter(
+            TranscriptionJob.status.in_(["queued", "running"])
+        )
+        orphaned = db.query(Podcast).filter(
+            Podcast.transcription_status.in_(["pending", "processing"]),
+            ~Podcast.id.in_(active_podcast_ids)
+        ).all()
+        for podcast in orphaned:
+            enqueue_transcription(db, podcast.id, podcast.file_path)
+
+        if requeued:
+            _job_available.set()
+        if requeued or orphaned:
+            print(f"Recovered {requeued} abandoned and {len(orphaned)} orphaned transcription jobs")
+    finally:
+        db.close()
+
+
+def maintenance_loop(stop_event: threading.Event):
+    """
+    Send heartbeats for this process's jobs and requeue abandoned ones
+
+    After stop_event is set, heartbeats continue until the jobs still
+    running in this process have finished.
+    """
+    while True:
+        if stop_event.is_set():
+            time.sleep(JOB_HEARTBEAT_INTERVAL)
+        else:
+            stop_event.wait(JOB_HEARTBEAT_INTERVAL)
+        stopping = stop_event.is_set()
+        running = None
+        db = SessionLocal()
+        try:
+            running = heartbeat(db)
+        except Exception as e:
+            print(f"Transcription heartbeat error: {str(e)}")
+        finally:
+            db.close()
+
+        if stopping:
+            if running == 0:
+                return
+            continue
+
+        try:
+            recover_jobs()
+        except Exception as e:
+            print(f"Transcription job recovery error: {str(e)}")
+
+
+def worker_loop(stop_event: threading.Event):
+    """Claim and run jobs until stop_event is set"""
+    while not stop_event.is_set():
+        db = SessionLocal()
+        try:
+            job = claim_job(db)
+            if job is not None:
+                run_job(db, job)
+                continue
+        except Exception as e:
+            print(f"Transcription worker error: {str(e)}")
+        finally:
+            db.close()
+
+        _job_available.wait(JOB_POLL_INTERVAL)
+        _job_available.clear()
+
+
+def start_workers(num_workers: int = TRANSCRIPTION_WORKERS) -> threading.Event:
+    """
+    Recover interrupted jobs and start the worker pool
+
+    Workers must run inside the web process: the vector store, BM25 index
+    and answer caches are per process and would not see their writes. A
+    maintenance thread keeps the heartbeats of running jobs fresh and
+    requeues jobs abandoned by an earlier process.
+
+    Args:
+        num_workers: Maximum number of jobs processed in parallel
+
+    Returns:
+        Event that stops the workers when set
+    """
+    recover_jobs()
+
+    stop_event = threading.Event()
+    for i in range(max(1, num_workers)):
+        threading.Thread(
+            target=worker_loop,
+            args=(stop_event,),
+            name=f"transcription-worker-{i}",
+            daemon=True
+        ).start()
+
+    threading.Thread(
+        target=maintenance_loop,
+        args=(stop_event,),
+        name="transcription-maintenance",
+        daemon=True
+    ).start()
+
+    return stop_event
@@ -0,0 +1,167 @@
+import json
+import math
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+import os
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# BM25 parameters
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# BM25 indexes kept in memory; the least recently used are dropped and reloaded from disk when needed
+LEXICAL_INDEX_CACHE_SIZE = int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", "64"))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase text and split it into word tokens"""
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """
+    In-memory BM25 inverted index over the chunks of one podcast
+
+    Postings map each term to {chunk number: term frequency}, so a query
+    only touches the chunks that contain one of its terms.
+    """
+
+    def __init__(
+        self,
+        documents: List[str],
+        postings: Dict[str, Dict[int, int]] = None,
+        lengths: List[int] = None,
+        metadatas: List[Dict] = None
+    ):
+        self.documents = documents
+        self.metadatas = metadatas
+        if postings is None or lengths is None:
+            postings, lengths = {}, []
+            for doc_id, document in enumerate(documents):
+                counts = Counter(tokenize(document))
+                lengths.append(sum(counts.values()))
+                for term, count in counts.items():
+                    postings.setdefault(term, {})[doc_id] = count
+        self.postings = postings
+        self.lengths = lengths
+        self.average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+
+    def search(self, query: str, n_results: int = 5) -> List[Dict]:
+        """
+        Rank chunks against a query with BM25
+
+        Returns:
+            List of dicts with 'text', 'score' and 'metadata' keys, best first
+        """
+        scores = {}
+        total = len(self.documents)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[doc_id] / self.average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:n_results]
+        return [
+            {
+                'text': self.documents[doc_id],
+                'score': score,
+                'metadata': self.metadatas[doc_id] if self.metadatas else {}
+            }
+            for doc_id, score in ranked
+        ]
+
+    def to_dict(self) -> Dict:
+        return {
+            "documents": self.documents,
+            "postings": self.postings,
+            "lengths": self.lengths,
+            "metadatas": self.metadatas
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "BM25Index":
+        # JSON object keys are strings; chunk numbers are ints
+        postings = {
+            term: {int(doc_id): count for doc_id, count in docs.items()}
+            for term, docs in data["postings"].items()
+        }
+        return cls(data["documents"], postings, data["lengths"], data.get("metadatas"))
+
+
+class LexicalIndexStore:
+    """
+    Keeps one BM25 index per collection, in memory and optionally on disk
+
+    With a persist directory every index is saved as <name>.bm25.json next
+    to the vector index, so it survives restarts like the vectors do, and
+    only the max_cached most recently used indexes stay in memory. Files are
+    written to a temporary file and renamed into place, so a crash never
+    leaves a truncated index. Without a persist directory, every index is
+    kept in memory.
+    """
+
+    def __init__(self, persist_directory: str = "", max_cached: int = LEXICAL_INDEX_CACHE_SIZE):
+        self.persist_directory = persist_directory
+        self.max_cached = max(1, max_cached)
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+        if persist_directory:
+            os.makedirs(persist_directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, f"{name}.bm25.json")
+
+    def build(self, name: str, documents: List[str], metadatas: List[Dict] = None):
+        """Build and store the index for a collection, replacing any existing one"""
+        index = BM25Index(documents, metadatas=metadatas)
+        with self._lock:
+            if self.persist_directory:
+                temp_path = f"{self._path(name)}.tmp"
+                with open(temp_path, "w", encoding="utf-8") as f:
+                    json.dump(index.to_dict(), f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temp_path, self._path(name))
+            self._remember(name, index)
+
+    def _remember(self, name: str, index: BM25Index):
+        """Keep an index in memory, evicting the least recently used ones that can be reloaded"""
+        self._indexes[name] = index
+        self._indexes.move_to_end(name)
+        if self.persist_directory:
+            while len(self._indexes) > self.max_cached:
+                self._indexes.popitem(last=False)
+
+    def get(self, name: str) -> Optional[BM25Index]:
+        """Return the index for a collection, loading it from disk if needed; None if missing or unreadable"""
+        with self._lock:
+            if name in self._indexes:
+                self._indexes.move_to_end(name)
+                return self._indexes[name]
+            if not self.persist_directory or not os.path.exists(self._path(name)):
+                return None
+            try:
+                with open(self._path(name), "r", encoding="utf-8") as f:
+                    index = BM25Index.from_dict(json.load(f))
+            except (ValueError, KeyError) as e:
+                # Treated as missing, so the startup reconciliation rebuilds it
+                print(f"Unreadable lexical index {name}: {str(e)}")
+                return None
+            self._remember(name, index)
+            return index
+
+    def delete(self, name: str):
+        with self._lock:
+            self._indexes.pop(name, None)
+            if self.persist_directory and os.path.exists(self._path(name)):
+                os.remove(self._path(name))
@@ -26,6 +26,25 @@ class LayerNorm(nn.Module):
     def forward(self, input):
         return F.layer_norm(input, self.weight.shape, self.weight, self.bias, 1e-5)
 
+class KVCache:
+    """ Keys and values of the positions processed so far, per layer, for incremental decoding """
+
+    def __init__(self, n_layer):
+        self.k = [None] * n_layer
+        self.v = [None] * n_layer
+
+    def __len__(self):
+        # number of cached positions
+        return 0 if self.k[0] is None else self.k[0].size(2)
+
+    def update(self, layer, k, v):
+        # append the keys/values of new positions for one layer, return all of them so far
+        if self.k[layer] is not None:
+            k = torch.cat((self.k[layer], k), dim=2)
+            v = torch.cat((self.v[layer], v), dim=2)
+        self.k[layer], self.v[layer] = k, v
+        return k, v
+
 class CausalSelfAttention(nn.Module):
 
     def __init__(self, config):
@@ -49,7 +68,7 @@ class CausalSelfAttention(nn.Module):
             self.register_buffer("bias", torch.tril(torch.ones(config.block_size, config.block_size))
                                      .view(1, 1, config.block_size, config.block_size))
 
-    def forward(self, x):
+    def forward(self, x, kv_cache=None, layer=0, attn_mask=None):
         B, T, C = x.size() # batch size, sequence length, embedding dimensionality (n_embd)
 
         # calculate query, key, values for all heads in batch and move head forward to be the batch dim
@@ -58,14 +77,33 @@ class CausalSelfAttention(nn.Module):
         q = q.view(B, T, self.n_head, C // self.n_head).transpose(1, 2) # (B, nh, T, hs)
         v = v.view(B, T, self.n_head, C // self.n_head).transpose(1, 2) # (B, nh, T, hs)
 
-        # causal self-attention; Self-attend: (B, nh, T, hs) x (B, nh, hs, T) -> (B, nh, T, T)
+        # with a cache, the new queries also attend to the keys/values of all earlier positions
+        if kv_cache is not None:
+            k, v = kv_cache.update(layer, k, v) # (B, nh, past + T, hs)
+        past = k.size(2) - T
+
+        # causal self-attention; Self-attend: (B, nh, T, hs) x (B, nh, hs, past + T) -> (B, nh, T, past + T)
+        # attn_mask, when given, is a full (B, 1, T, past + T) boolean mask that already includes causality
         if self.flash:
             # efficient attention using Flash Attention CUDA kernels
-            y = torch.nn.functional.scaled_dot_product_attention(q, k, v, attn_mask=None, dropout_p=self.dropout if self.training else 0, is_causal=True)
+            # is_causal aligns the mask top-left, so queries offset by cached positions need an explicit mask
+            if attn_mask is not None:
+                is_causal = False
+            elif past == 0:
+                attn_mask, is_causal = None, True
+            elif T == 1:
+                attn_mask, is_causal = None, False # a single newest query may attend to everything
+            else:
+                attn_mask = torch.ones(T, past + T, dtype=torch.bool, device=x.device).tril(diagonal=past)
+                is_causal = False
+            y = torch.nn.functional.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask, dropout_p=self.dropout if self.training else 0, is_causal=is_causal)
         else:
             # manual implementation of attention
             att = (q @ k.transpose(-2, -1)) * (1.0 / math.sqrt(k.size(-1)))
-            att = att.masked_fill(self.bias[:,:,:T,:T] == 0, float('-inf'))
+            if attn_mask is not None:
+                att = att.masked_fill(~attn_mask, float('-inf'))
+            else:
+                att = att.masked_fill(self.bias[:,:,past:past+T,:past+T] == 0, float('-inf'))
             att = F.softmax(att, dim=-1)
             att = self.attn_dropout(att)
             y = att @ v # (B, nh, T, T) x (B, nh, T, hs) -> (B, nh, T, hs)
@@ -100,8 +138,8 @@ class Block(nn.Module):
         self.ln_2 = LayerNorm(config.n_embd, bias=config.bias)
         self.mlp = MLP(config)
 
-    def forward(self, x):
-        x = x + self.attn(self.ln_1(x))
+    def forward(self, x, kv_cache=None, layer=0, attn_mask=None):
+        x = x + self.attn(self.ln_1(x), kv_cache, layer, attn_mask)
         x = x + self.mlp(self.ln_2(x))
         return x
 
@@ -157,18 +195,30 @@ class GPT(nn.Module):
         elif isinstance(module, nn.Embedding):
             torch.nn.init.normal_(module.weight, mean=0.0, std=0.02)
 
-    def forward(self, idx, targets=None):
+    def forward(self, idx, targets=None, kv_cache=None, attention_mask=None):
+        """
+        attention_mask (optional, bool of shape (b, past + t)) marks the real tokens of the
+        cached and new positions; padding is ignored by attention and does not count as a position.
+        """
         device = idx.device
         b, t = idx.size()
-        assert t <= self.config.block_size, f"Cannot forward sequence of length {t}, block size is only {self.config.block_size}"
-        pos = torch.arange(0, t, dtype=torch.long, device=device)
+        # positions already in the cache come before the new tokens
+        past = len(kv_cache) if kv_cache is not None else 0
+        assert past + t <= self.config.block_size, f"Cannot forward sequence of length {past + t}, block size is only {self.config.block_size}"
+        attn_mask = None
+        if attention_mask is None:
+            pos = torch.arange(past, past + t, dtype=torch.long, device=device) # shape (t)
+        else:
+            # each row counts positions from its first real token, so left padding does not shift them
+            pos = (attention_mask.long().cumsum(dim=-1) - 1).clamp(min=0)[:, -t:] # shape (b, t)
+            attn_mask = self._padded_causal_mask(attention_mask, t)
 
         # forward the GPT model itself
         tok_emb = self.transformer.wte(idx) # token embeddings of shape (b, t, n_embd)
-        pos_emb = self.transformer.wpe(pos) # position embeddings of shape (t, n_embd)
+        pos_emb = self.transformer.wpe(pos) # position embeddings of shape (t, n_embd) or (b, t, n_embd)
         x = self.transformer.drop(tok_emb + pos_emb)
-        for block in self.transformer.h:
-            x = block(x)
+        for layer, block in enumerate(self.transformer.h):
+            x = block(x, kv_cache, layer, attn_mask)
         x = self.transformer.ln_f(x)
 
         if targets is not None:
@@ -182,13 +232,37 @@ class GPT(nn.Module):
 
         return logits, loss
 
+    @staticmethod
+    def _padded_causal_mask(attention_mask, t):
+        # (b, 1, t, past + t) mask: causal, and padding keys hidden. Every query may still see itself
+        # so padding rows never softmax over nothing (NaNs there would leak through 0 * NaN in att @ v)
+        total = attention_mask.size(1)
+        key_pos = torch.arange(total, device=attention_mask.device)
+        query_pos = torch.arange(total - t, total, device=attention_mask.device)
+        causal = key_pos[None, :] <= query_pos[:, None]
+        itself = key_pos[None, :] == query_pos[:, None]
+        return causal & (attention_mask[:, None, None, :] | itself)
+
     @torch.no_grad()
-    def generate(self, idx, max_new_tokens, temperature=1.0, top_k=None):
+    def generate(self, idx, max_new_tokens, temperature=1.0, top_k=None, use_cache=True):
+        """
+        Take a conditioning sequence of indices idx (LongTensor of shape (b,t)) and complete
+        the sequence max_new_tokens times, feeding the predictions back into the model each time.
+        With use_cache, keys/values of earlier positions are kept in a KVCache so each step
+        only runs the newest token through the model.
+        """
+        kv_cache = None
         for _ in range(max_new_tokens):
-            # if the sequence context is growing too long we must crop it at block_size
-            idx_cond = idx if idx.size(1) <= self.config.block_size else idx[:, -self.config.block_size:]
-            # forward the model to get the logits for the index in the sequence
-            logits, _ = self(idx_cond)
+            if use_cache and kv_cache is not None and len(kv_cache) < self.config.block_size:
+                # only the newest token is new; everything before it is in the cache
+                logits, _ = self(idx[:, -1:], kv_cache=kv_cache)
+            else:
+                # if the sequence context is growing too long we must crop it at block_size
+                idx_cond = idx if idx.size(1) <= self.config.block_size else idx[:, -self.config.block_size:]
+                # positions are absolute, so once the window slides the cache is rebuilt from the cropped context
+                kv_cache = KVCache(self.config.n_layer) if use_cache else None
+                # forward the model to get the logits for the index in the sequence
+                logits, _ = self(idx_cond, kv_cache=kv_cache)
             # pluck the logits at the final step and scale by desired temperature
             logits = logits[:, -1, :] / temperature
             # optionally crop the logits to only the top k options
@@ -202,4 +276,73 @@ class GPT(nn.Module):
             # append sampled index to the running sequence and continue
             idx = torch.cat((idx, idx_next), dim=1)
 
-        return idx
\ No newline at end of file
+        return idx
+
+    @torch.no_grad()
+    def generate_batch(self, prompts, max_new_tokens, temperature=1.0, top_k=None, num_samples=1, eos_token=None, pad_token=0):
+        """
+        Complete many prompts (lists of token indices, possibly of different lengths) as one batch.
+        Every prompt is sampled num_samples times, and each row stops on its own when it samples
+        eos_token or after max_new_tokens. Returns len(prompts) * num_samples token lists, grouped
+        by prompt, each holding the prompt followed by its completion (without eos_token).
+        """
+        rows = [list(prompt) for prompt in prompts for _ in range(num_samples)]
+        completions = [[] for _ in rows]
+        for step in self.generate_stream(rows, max_new_tokens, temperature, top_k, eos_token, pad_token):
+            for completion, token in zip(completions, step):
+                if token is not None:
+                    completion.append(token)
+        return [row + completion for row, completion in zip(rows, completions)]
+
+    @torch.no_grad()
+    def generate_stream(self, prompts, max_new_tokens, temperature=1.0, top_k=None, eos_token=None, pad_token=0):
+        """
+        Generate for a batch of prompts one step at a time. Prompts are left-padded to a common
+        length and the padding is masked out of attention. max_new_tokens is one limit for all
+        rows or a list with one limit per row; a row also stops when it samples eos_token.
+        After every step yields a list with the new token of each row, or None for rows that
+        have finished (the eos_token itself is not yielded).
+        """
+        device = self.transformer.wte.weight.device
+        assert prompts and all(prompts), "prompts must be non-empty"
+        if isinstance(max_new_tokens, int):
+            max_new_tokens = [max_new_tokens] * len(prompts)
+        limits = torch.tensor(max_new_tokens, dtype=torch.long, device=device)
+
+        # left-pad so the newest token of every row is in the last column
+        width = max(len(prompt) for prompt in prompts)
+        idx = torch.full((len(prompts), width), pad_token, dtype=torch.long, device=device)
+        mask = torch.zeros((len(prompts), width), dtype=torch.bool, device=device)
+        for i, prompt in enumerate(prompts):
+            idx[i, width - len(prompt):] = torch.tensor(prompt, dtype=torch.long, device=device)
+            mask[i, width - len(prompt):] = True
+
+        done = limits <= 0
+        kv_cache = None
+        for step in range(max(max_new_tokens)):
+            if done.all():
+                break
+            if kv_cache is not None and len(kv_cache) < self.config.block_size:
+                logits, _ = self(idx[:, -1:], kv_cache=kv_cache, attention_mask=mask[:, -(len(kv_cache) + 1):])
+            else:
+                # crop at block_size and (re)build the cache, as in generate
+                kv_cache = KVCache(self.config.n_layer)
+                logits, _ = self(idx[:, -self.config.block_size:], kv_cache=kv_cache, attention_mask=mask[:, -self.config.block_size:])
+            logits = logits[:, -1, :] / temperature
+            if top_k is not None:
+                v, _ = torch.topk(logits, min(top_k, logits.size(-1)))
+                logits[logits < v[:, [-1]]] = -float('Inf')
+            probs = F.softmax(logits, dim=-1)
+            idx_next = torch.multinomial(probs, num_samples=1)
+            # finished rows keep the batch shape with padding that nothing attends to
+            idx_next = idx_next.masked_fill(done[:, None], pad_token)
+            active = ~done
+            if eos_token is not None:
+                done = done | (idx_next[:, 0] == eos_token)
+            yield [
+                token if not finished else None
+                for token, finished in zip(idx_next[:, 0].tolist(), done.tolist())
+            ]
+            done = done | (limits <= step + 1)
+            idx = torch.cat((idx, idx_next), dim=1)
+            mask = torch.cat((mask, active[:, None]), dim=1)
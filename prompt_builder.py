@@ -0,0 +1,163 @@
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List
+import os
+import tiktoken
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4")
+# Tokens available for the whole prompt (system context, history and question).
+# GPT-4 has an 8k window and replies use up to 500 tokens.
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "6000"))
+# Part of the budget that chat history may use before context chunks are packed
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+
+# Per-message formatting overhead used by OpenAI chat models
+TOKENS_PER_MESSAGE = 3
+# Every reply is primed with <|start|>assistant<|message|>
+TOKENS_PER_REPLY = 3
+# Overlapping text shorter than this is left alone when deduplicating chunks
+MIN_CHUNK_OVERLAP = 40
+# Longest overlap searched for; chunks are split with a 200 character overlap
+MAX_CHUNK_OVERLAP = 400
+
+SYSTEM_PROMPT = """You are a helpful AI assistant that answers questions about podcast content.
+You have access to the following transcription excerpts from the podcast:
+
+{context}
+
+Answer the user's questions based on this content. If the answer is not in the provided excerpts,
+say so. Be conversational and helpful. Cite specific parts of the transcription when relevant."""
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str = CHAT_MODEL):
+    """Return the tiktoken encoding for a model"""
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = CHAT_MODEL) -> int:
+    """Count the tokens in a piece of text"""
+    return len(get_encoding(model).encode(text))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], model: str = CHAT_MODEL) -> int:
+    """Count the prompt tokens of a list of chat messages"""
+    total = TOKENS_PER_REPLY
+    for message in messages:
+        total += TOKENS_PER_MESSAGE + count_tokens(message["content"], model)
+    return total
+
+
+def _overlap_length(left: str, right: str) -> int:
+    """Length of the longest suffix of left that is also a prefix of right"""
+    longest = min(len(left), len(right), MAX_CHUNK_OVERLAP)
+    for size in range(longest, MIN_CHUNK_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def deduplicate_chunks(texts: List[str]) -> List[str]:
+    """
+    Remove text repeated between retrieved chunks
+
+    Adjacent chunks from the text splitter share up to 200 characters, so
+    the overlapping start or end of a chunk is trimmed when it repeats text
+    already kept, and chunks fully contained in kept text are dropped.
+
+    Args:
+        texts: Chunk texts in relevance order
+
+    Returns:
+        Deduplicated chunk texts in the same order
+    """
+    kept = []
+    for text in texts:
+        text = text.strip()
+        if not text or any(text in other for other in kept):
+            continue
+        for other in kept:
+            start = _overlap_length(other, text)
+            if start:
+                text = text[start:].strip()
+            end = _overlap_length(text, other)
+            if end:
+                text = text[:-end].strip()
+        if text:
+            kept.append(text)
+    return kept
+
+
+@dataclass
+class BuiltPrompt:
+    messages: List[Dict[str, str]]
+    prompt_tokens: int
+    context_chunks: int
+    history_messages: int
+
+
+def build_chat_prompt(
+    context_texts: List[str],
+    user_query: str,
+    chat_history: List[Dict[str, str]] = None,
+    token_budget: int = PROMPT_TOKEN_BUDGET,
+    history_budget: int = HISTORY_TOKEN_BUDGET,
+    model: str = CHAT_MODEL
+) -> BuiltPrompt:
+    """
+    Pack retrieved context and chat history into a token budget
+
+    The system instructions and the question are always included. Recent
+    history is added newest first up to history_budget, then deduplicated
+    context chunks are added in relevance order while they fit.
+
+    Args:
+        context_texts: Retrieved chunk texts, most relevant first
+        user_query: User's question
+        chat_history: Previous chat messages, oldest first
+        token_budget: Maximum prompt tokens
+        history_budget: Maximum tokens spent on chat history
+        model: Model whose tokenizer is used for counting
+
+    Returns:
+        BuiltPrompt with the messages and the prompt token count
+    """
+    question = {"role": "user", "content": user_query}
+    used = count_message_tokens([{"role": "system", "content": SYSTEM_PROMPT.format(context="")}, question], model)
+
+    # Most recent history first, until the history share of the budget is spent
+    history = []
+    history_used = 0
+    for message in reversed(chat_history or []):
+        cost = TOKENS_PER_MESSAGE + count_tokens(message["content"], model)
+        if history_used + cost > min(history_budget, token_budget - used):
+            break
+        history.insert(0, message)
+        history_used += cost
+    used += history_used
+
+    # Context chunks in relevance order while they fit
+    context = []
+    for text in deduplicate_chunks(context_texts):
+        cost = count_tokens(text + "\n\n", model)
+        if used + cost > token_budget:
+            continue
+        context.append(text)
+        used += cost
+
+    messages = [{"role": "system", "content": SYSTEM_PROMPT.format(context="\n\n".join(context))}]
+    messages.extend(history)
+    messages.append(question)
+
+    return BuiltPrompt(
+        messages=messages,
+        prompt_tokens=count_message_tokens(messages, model),
+        context_chunks=len(context),
+        history_messages=len(history)
+    )
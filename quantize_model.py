@@ -0,0 +1,108 @@
+"""
+Post-training dynamic int8 quantization of the GPT model for CPU inference
+
+The nn.Linear layers (attention and MLP projections and lm_head) get int8
+weights; activations are quantized on the fly at every matmul. Embeddings and
+LayerNorms stay in float32.
+
+Usage:
+    python quantize_model.py --checkpoint model_output/ckpt.pt --out model_output/ckpt_int8.pt --data data/val.bin
+"""
+import argparse
+import io
+import math
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+
+from new_model import GPTConfig, GPT
+
+# Marker stored in quantized checkpoints so loaders rebuild the quantized modules first
+QUANTIZATION = "dynamic_int8"
+
+
+def quantize(model: GPT) -> GPT:
+    """Return a copy of model with every nn.Linear dynamically quantized to int8"""
+    return torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+
+
+def save_quantized(model: GPT, model_args: dict, path: str):
+    torch.save({'model': model.state_dict(), 'model_args': model_args, 'quantization': QUANTIZATION}, path)
+
+
+def load_quantized(path: str) -> GPT:
+    """Build a quantized GPT from a checkpoint written by save_quantized (CPU only)"""
+    checkpoint = torch.load(path, map_location='cpu')
+    assert checkpoint.get('quantization') == QUANTIZATION, f"{path} is not a {QUANTIZATION} checkpoint"
+    model = quantize(GPT(GPTConfig(**checkpoint['model_args'])))
+    model.load_state_dict(checkpoint['model'])
+    model.eval()
+    return model
+
+
+def state_dict_bytes(model: nn.Module) -> int:
+    """Size of the serialized weights"""
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell()
+
+
+@torch.no_grad()
+def perplexity(model: GPT, windows: torch.Tensor, batch_size: int = 8) -> float:
+    """Perplexity of model over token windows of shape (n, block_size + 1)"""
+    total_loss, total_tokens = 0.0, 0
+    for start in range(0, windows.size(0), batch_size):
+        batch = windows[start:start + batch_size]
+        targets = batch[:, 1:].contiguous()
+        _, loss = model(batch[:, :-1], targets=targets)
+        total_loss += loss.item() * targets.numel()
+        total_tokens += targets.numel()
+    return math.exp(total_loss / total_tokens)
+
+
+def sample_windows(data_path: str, block_size: int, num_windows: int, seed: int = 1337) -> torch.Tensor:
+    """Pick the same random evaluation windows from a uint16 token file for every model"""
+    data = np.memmap(data_path, dtype=np.uint16, mode='r')
+    generator = torch.Generator().manual_seed(seed)
+    starts = torch.randint(len(data) - block_size - 1, (num_windows,), generator=generator)
+    return torch.stack([torch.from_numpy(data[i:i + block_size + 1].astype(np.int64)) for i in starts.tolist()])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--checkpoint', default=os.path.join('model_output', 'ckpt.pt'))
+    parser.add_argument('--out', default=os.path.join('model_output', 'ckpt_int8.pt'))
+    parser.add_argument('--data', default=os.path.join('data', 'val.bin'), help="uint16 token file for the perplexity check")
+    parser.add_argument('--windows', type=int, default=64, help="evaluation windows of block_size tokens")
+    args = parser.parse_args()
+
+    checkpoint = torch.load(args.checkpoint, map_location='cpu')
+    model_args = checkpoint['model_args']
+    model = GPT(GPTConfig(**model_args))
+    model.load_state_dict(checkpoint['model'])
+    model.eval()
+
+    quantized = quantize(model)
+    save_quantized(quantized, model_args, args.out)
+    print(f"Saved quantized model to {args.out}")
+    print(f"Weights: {state_dict_bytes(model) / 1e6:.1f}MB float32 -> {state_dict_bytes(quantized) / 1e6:.1f}MB int8")
+
+    if not os.path.exists(args.data):
+        print(f"No {args.data} found, skipping the perplexity check")
+        return
+
+    windows = sample_windows(args.data, model.config.block_size, args.windows)
+    results = {}
+    for name, candidate in (("float32", model), ("int8", quantized)):
+        start = time.perf_counter()
+        results[name] = perplexity(candidate, windows)
+        print(f"{name:>7}: perplexity {results[name]:.4f} ({time.perf_counter() - start:.2f}s)")
+    drift = (results["int8"] - results["float32"]) / results["float32"] * 100
+    print(f"Perplexity drift: {drift:+.2f}%")
+
+
+if __name__ == '__main__':
+    main()
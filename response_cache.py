@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+import os
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Set to "false" to disable the semantic answer cache
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() == "true"
+# Minimum cosine similarity between questions for a cached answer to be reused
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.95"))
+# Seconds a cached answer stays valid
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Maximum cached answers per podcast before least recently used ones are evicted
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "256"))
+
+
+class SemanticResponseCache:
+    """
+    Per-podcast cache of answers keyed by question embedding
+
+    A new question reuses a cached answer when its embedding is within
+    threshold cosine similarity of a previously answered question for the
+    same podcast. Each answer is stored with the version of the transcription
+    it was built from (e.g. its created_at) and is only reused for that
+    version, so a re-transcribed podcast never gets answers about its old
+    transcript. Entries expire after ttl seconds and each podcast keeps at
+    most max_entries answers, evicting the least recently used.
+    """
+
+    def __init__(
+        self,
+        threshold: float = RESPONSE_CACHE_THRESHOLD,
+        ttl: float = RESPONSE_CACHE_TTL,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max(1, max_entries)
+        # podcast_id -> OrderedDict of question -> (unit embedding, answer, sources, version, created_at)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(
+        self,
+        podcast_id: int,
+        embedding: List[float],
+        version: Hashable = None
+    ) -> Optional[Tuple[str, List[Dict]]]:
+        """
+        Find a cached answer for a similar question
+
+        Args:
+            podcast_id: ID of the podcast
+            embedding: Embedding of the new question
+            version: Version of the podcast's current transcription
+
+        Returns:
+            Tuple of (answer, sources) cached with it, or None on a miss
+        """
+        with self._lock:
+            entries = self._entries.get(podcast_id)
+            if not entries:
+                return None
+
+            # Drop expired answers and answers about an older transcription
+            now = time.time()
+            stale = [q for q, entry in entries.items() if now - entry[4] > self.ttl or entry[3] != version]
+            for question in stale:
+                del entries[question]
+            if not entries:
+                return None
+
+            questions = list(entries.keys())
+            matrix = np.stack([entries[q][0] for q in questions])
+            similarities = matrix @ self._normalize(embedding)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+
+            entries.move_to_end(questions[best])
+            _, answer, sources, _, _ = entries[questions[best]]
+            return answer, list(sources)
+
+    def store(
+        self,
+        podcast_id: int,
+        embedding: List[float],
+        question: str,
+        answer: str,
+        sources: Optional[List[Dict]] = None,
+        version: Hashable = None
+    ):
+        """
+        Cache the answer to a question
+
+        Args:
+            podcast_id: ID of the podcast
+            embedding: Embedding of the question
+            question: Question text
+            answer: Generated answer
+            sources: Excerpts the answer was built from, returned with it on a hit
+            version: Version of the transcription the answer was built from
+        """
+        with self._lock:
+            entries = self._entries.setdefault(podcast_id, OrderedDict())
+            entries[question] = (self._normalize(embedding), answer, list(sources or []), version, time.time())
+            entries.move_to_end(question)
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, podcast_id: int):
+        """Forget all cached answers for a podcast"""
+        with self._lock:
+            self._entries.pop(podcast_id, None)
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> Optional[SemanticResponseCache]:
+    """Return the process-wide answer cache, or None when it is disabled"""
+    global _response_cache
+    if not RESPONSE_CACHE_ENABLED:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = SemanticResponseCache()
+        return _response_cache
@@ -0,0 +1,141 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import List
+import os
+from openai import OpenAI
+from sqlalchemy.exc import IntegrityError
+from dotenv import load_dotenv
+
+from database import SessionLocal, SectionSummary
+from prompt_builder import CHAT_MODEL, count_tokens, get_encoding
+
+load_dotenv()
+
+client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+
+# Transcript tokens per section in the map step
+SUMMARY_SECTION_TOKENS = int(os.getenv("SUMMARY_SECTION_TOKENS", "3000"))
+# Maximum tokens of summaries combined in one reduce call
+SUMMARY_REDUCE_TOKENS = int(os.getenv("SUMMARY_REDUCE_TOKENS", "5000"))
+# Maximum number of summarization calls in flight at the same time
+SUMMARY_MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+
+SYSTEM_PROMPT = "You are a helpful assistant that summarizes podcast transcriptions."
+MAP_PROMPT = "Summarize this section of a podcast transcription. Keep the key points, names and claims:\n\n{text}"
+REDUCE_PROMPT = "These are summaries of consecutive parts of one podcast. Combine them into a single summary that keeps the key points in order:\n\n{text}"
+FINAL_PROMPT = "These are summaries of consecutive parts of one podcast. Write a concise summary of the whole episode:\n\n{text}"
+
+
+def split_into_sections(text: str, max_tokens: int = SUMMARY_SECTION_TOKENS) -> List[str]:
+    """Split text into consecutive sections of at most max_tokens tokens"""
+    encoding = get_encoding(CHAT_MODEL)
+    tokens = encoding.encode(text)
+    return [
+        encoding.decode(tokens[start:start + max_tokens])
+        for start in range(0, len(tokens), max_tokens)
+    ]
+
+
+def _cache_key(prompt: str, text: str) -> str:
+    return hashlib.sha256(f"{CHAT_MODEL}\n{prompt}\n{text}".encode("utf-8")).hexdigest()
+
+
+def _summarize(prompt: str, text: str, max_tokens: int, use_cache: bool = True) -> str:
+    """
+    Summarize text with one chat completion, reusing a cached result
+
+    Results are stored by hash of model, prompt and text, so re-running a
+    summary only pays for sections whose text changed. With use_cache=False
+    the model is always called and the new result replaces the cached one.
+    """
+    key = _cache_key(prompt, text)
+    db = SessionLocal()
+
+    try:
+        if use_cache:
+            cached = db.query(SectionSummary).filter(SectionSummary.text_hash == key).first()
+            if cached:
+                return cached.summary
+
+        response = client.chat.completions.create(
+            model=CHAT_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt.format(text=text)}
+            ],
+            temperature=0.5,
+            max_tokens=max_tokens
+        )
+        summary = response.choices[0].message.content
+
+        if use_cache:
+            db.add(SectionSummary(text_hash=key, summary=summary))
+        else:
+            db.merge(SectionSummary(text_hash=key, summary=summary, created_at=datetime.utcnow()))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another worker summarized the same text
+            db.rollback()
+        return summary
+    finally:
+        db.close()
+
+
+def _summarize_all(prompt: str, texts: List[str], max_tokens: int) -> List[str]:
+    """Summarize texts in parallel, keeping their order"""
+    workers = max(1, min(SUMMARY_MAX_CONCURRENCY, len(texts)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(lambda text: _summarize(prompt, text, max_tokens), texts))
+
+
+def _group_by_tokens(texts: List[str], max_tokens: int) -> List[str]:
+    """Join consecutive texts into groups of at most max_tokens tokens"""
+    groups = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if current and current_tokens + tokens > max_tokens:
+            groups.append("\n\n".join(current))
+            current = []
+            current_tokens = 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        groups.append("\n\n".join(current))
+    return groups
+
+
+def summarize_transcription(transcription_text: str, refresh: bool = False) -> str:
+    """
+    Summarize a full transcription with map-reduce
+
+    The transcript is split into sections that are summarized in parallel
+    (map). Section summaries are combined in groups until they fit one call
+    (reduce), and a final call writes the episode summary. Every call is
+    cached by content, so a re-run is incremental.
+
+    Args:
+        transcription_text: Full transcription text
+        refresh: Write a new episode summary instead of returning the cached
+            one; section summaries are still reused
+
+    Returns:
+        Summary text
+    """
+    sections = split_into_sections(transcription_text)
+    if not sections:
+        return ""
+
+    summaries = _summarize_all(MAP_PROMPT, sections, max_tokens=400)
+
+    while len(summaries) > 1:
+        groups = _group_by_tokens(summaries, SUMMARY_REDUCE_TOKENS)
+        # Stop when everything fits one call, or when summaries are too long to combine
+        if len(groups) == 1 or len(groups) == len(summaries):
+            break
+        summaries = _summarize_all(REDUCE_PROMPT, groups, max_tokens=500)
+
+    return _summarize(FINAL_PROMPT, "\n\n".join(summaries), max_tokens=300, use_cache=not refresh)
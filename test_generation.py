@@ -0,0 +1,96 @@
+import torch
+from new_model import GPT, GPTConfig, KVCache
+
+def make_model(flash=True):
+    # Small model with a short block size so generation runs past it quickly
+    torch.manual_seed(1337)
+    config = GPTConfig(
+        block_size=32,
+        vocab_size=100,
+        n_layer=2,
+        n_head=4,
+        n_embd=64,
+        dropout=0.0,
+        bias=True
+    )
+    model = GPT(config)
+    # larger random weights so outputs depend strongly on positions and context;
+    # at the default init greedy tokens barely change even when positions are wrong
+    with torch.no_grad():
+        for param in model.parameters():
+            param.normal_(0.0, 0.5)
+    model.eval()
+    if not flash:
+        # switch every layer to the manual attention implementation
+        for block in model.transformer.h:
+            block.attn.flash = False
+            block.attn.register_buffer("bias", torch.tril(torch.ones(config.block_size, config.block_size))
+                                        .view(1, 1, config.block_size, config.block_size))
+    return model
+
+def random_prompts(lengths, vocab_size=100):
+    generator = torch.Generator().manual_seed(0)
+    return [torch.randint(1, vocab_size, (n,), generator=generator).tolist() for n in lengths]
+
+@torch.no_grad()
+def test_cached_logits_match_full_forward():
+    for flash in (True, False):
+        model = make_model(flash)
+        idx = torch.tensor(random_prompts([model.config.block_size]))
+        kv_cache = KVCache(model.config.n_layer)
+        # prompt in one piece, then one token at a time through the cache
+        model(idx[:, :10], kv_cache=kv_cache)
+        for t in range(10, idx.size(1)):
+            cached_logits, _ = model(idx[:, t:t + 1], kv_cache=kv_cache)
+            full_logits, _ = model(idx[:, :t + 1])
+            assert torch.allclose(cached_logits, full_logits, atol=1e-4), \
+                f"cached logits differ at position {t} (flash={flash})"
+    print("Cached logits match full forward logits")
+
+def test_cached_generate_matches_uncached():
+    # top_k=1 makes sampling greedy, so both paths must produce the same tokens
+    for flash in (True, False):
+        model = make_model(flash)
+        # short prompt that grows past block_size, and a prompt longer than block_size
+        for length in (5, 40):
+            idx = torch.tensor(random_prompts([length]))
+            cached = model.generate(idx, 40, top_k=1, use_cache=True)
+            uncached = model.generate(idx, 40, top_k=1, use_cache=False)
+            assert torch.equal(cached, uncached), f"cached generate differs (flash={flash}, prompt length {length})"
+    print("Cached generate matches uncached generate")
+
+@torch.no_grad()
+def test_left_padding_matches_unpadded():
+    for flash in (True, False):
+        model = make_model(flash)
+        prompts = random_prompts([3, 9, 16])
+        width = max(len(prompt) for prompt in prompts)
+        idx = torch.zeros((len(prompts), width), dtype=torch.long)
+        mask = torch.zeros((len(prompts), width), dtype=torch.bool)
+        for i, prompt in enumerate(prompts):
+            idx[i, width - len(prompt):] = torch.tensor(prompt)
+            mask[i, width - len(prompt):] = True
+        padded_logits, _ = model(idx, attention_mask=mask)
+        for i, prompt in enumerate(prompts):
+            logits, _ = model(torch.tensor([prompt]))
+            assert torch.allclose(padded_logits[i, -1], logits[0, -1], atol=1e-5), \
+                f"left-padded logits differ (flash={flash}, prompt length {len(prompt)})"
+    print("Left-padded logits match unpadded logits")
+
+def test_generate_batch_matches_generate():
+    for flash in (True, False):
+        model = make_model(flash)
+        # mixed lengths, including prompts longer than block_size
+        prompts = random_prompts([4, 11, 30, 45])
+        batch = model.generate_batch(prompts, 20, top_k=1)
+        for prompt, row in zip(prompts, batch):
+            single = model.generate(torch.tensor([prompt]), 20, top_k=1)
+            assert row == single[0].tolist(), \
+                f"generate_batch differs from generate (flash={flash}, prompt length {len(prompt)})"
+    print("Greedy generate_batch matches per-prompt generate")
+
+if __name__ == '__main__':
+    test_cached_logits_match_full_forward()
+    test_cached_generate_matches_uncached()
+    test_left_padding_matches_unpadded()
+    test_generate_batch_matches_generate()
@@ -4,7 +4,7 @@ Simple test script for students to test the trained model
 import os
 import pickle
 import torch
-from model import GPTConfig, GPT
+from new_model import GPTConfig, GPT
 
 # Set device
 device = 'cpu'  # Safe for all students
@@ -51,21 +51,24 @@ model.to(device)
 print(f"Model loaded successfully. Parameters: {sum(p.numel() for p in model.parameters())/1e6:.2f}M")
 
 # Generate some text
-prompt = "ROMEO:"
-context = encode(prompt)
-x = torch.tensor(context, dtype=torch.long, device=device).unsqueeze(0)
+prompts = ["ROMEO:", "JULIET:"]
 
-print(f"\nPrompt: '{prompt}'")
+print(f"\nPrompts: {prompts}")
 print("Generated text:")
 print("-" * 40)
 
-# Generate
-with torch.no_grad():
-    for i in range(3):  # Generate 3 samples
-        y = model.generate(x, max_new_tokens=100, temperature=0.8, top_k=200)
-        generated_text = decode(y[0].tolist())
-        print(f"Sample {i+1}:")
-        print(generated_text)
-        print("-" * 40)
+# Generate 3 samples per prompt in one batch
+num_samples = 3
+samples = model.generate_batch(
+    [encode(prompt) for prompt in prompts],
+    max_new_tokens=100,
+    temperature=0.8,
+    top_k=200,
+    num_samples=num_samples
+)
+for i, sample in enumerate(samples):
+    print(f"Prompt {i // num_samples + 1}, sample {i % num_samples + 1}:")
+    print(decode(sample))
+    print("-" * 40)
 
 print("\nModel test completed successfully!")
\ No newline at end of file
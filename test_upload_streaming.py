@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from fastapi import HTTPException
+from starlette.requests import Request
+from upload_streaming import receive_upload
+
+BOUNDARY = "testboundary1234"
+
+def multipart_body(parts):
+    """Encode (field name, filename or None, data) parts as a multipart/form-data body"""
+    body = b""
+    for name, filename, data in parts:
+        disposition = f'form-data; name="{name}"'
+        if filename is not None:
+            disposition += f'; filename="{filename}"'
+        body += f"--{BOUNDARY}\r\nContent-Disposition: {disposition}\r\n\r\n".encode() + data + b"\r\n"
+    return body + f"--{BOUNDARY}--\r\n".encode()
+
+def make_request(chunks, content_length=None):
+    """Request whose body arrives in the given chunks; records how many were read"""
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    messages = [{"type": "http.request", "body": chunk, "more_body": True} for chunk in chunks]
+    messages.append({"type": "http.request", "body": b"", "more_body": False})
+    received = []
+
+    async def receive():
+        received.append(1)
+        return messages.pop(0)
+
+    request = Request({"type": "http", "method": "POST", "path": "/", "headers": headers}, receive)
+    return request, received
+
+def split(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+def upload(chunks, content_length=None, max_size=10 * 1024 * 1024):
+    """Run receive_upload into a fresh directory; returns (result or HTTPException, directory)"""
+    directory = tempfile.mkdtemp()
+    request, _ = make_request(chunks, content_length)
+    try:
+        result = asyncio.run(receive_upload(request, lambda name: os.path.join(directory, name), max_size))
+    except HTTPException as e:
+        result = e
+    return result, directory
+
+def test_boundary_split_across_chunks():
+    data = os.urandom(3000) + b"\r\n--" + BOUNDARY[:5].encode() + os.urandom(3000)
+    body = multipart_body([("title", None, b"x"), ("file", "a.mp3", data)])
+    # 7-byte chunks split every boundary and header across reads
+    result, directory = upload(split(body, 7))
+    assert result.filename == "a.mp3" and result.size == len(data)
+    assert result.content_hash == hashlib.sha256(data).hexdigest()
+    with open(result.file_path, "rb") as f:
+        assert f.read() == data
+    assert os.listdir(directory) == ["a.mp3"]
+    print("Boundary split across chunks saved intact")
+
+def test_large_file_written_in_buffers():
+    # several WRITE_BUFFER_SIZE flushes plus a partial one
+    data = os.urandom(2 * 1024 * 1024 + 12345)
+    result, directory = upload(split(multipart_body([("file", "big.wav", data)]), 64 * 1024))
+    assert result.size == len(data) and result.content_hash == hashlib.sha256(data).hexdigest()
+    assert os.listdir(directory) == ["big.wav"]
+    print("Large file saved intact")
+
+def test_missing_file_field():
+    result, directory = upload([multipart_body([("title", None, b"x"), ("other", "a.mp3", b"data")])])
+    assert isinstance(result, HTTPException) and result.status_code == 400
+    assert os.listdir(directory) == []
+    print("Missing file field rejected")
+
+def test_oversize_with_content_length_rejected_before_reading():
+    body = multipart_body([("file", "a.mp3", b"x" * 200_000)])
+    request, received = make_request(split(body, 1024), content_length=len(body))
+    try:
+        asyncio.run(receive_upload(request, lambda name: os.path.join(tempfile.mkdtemp(), name), 100_000))
+        assert False, "oversize upload accepted"
+    except HTTPException as e:
+        assert e.status_code == 413
+    assert not received
+    print("Oversize upload with Content-Length rejected before reading")
+
+def test_oversize_without_content_length():
+    body = multipart_body([("file", "a.mp3", b"x" * 200_000)])
+    result, directory = upload(split(body, 1024), max_size=100_000)
+    assert isinstance(result, HTTPException) and result.status_code == 413
+    assert os.listdir(directory) == []
+    print("Oversize chunked upload rejected without leaving a .part file")
+
+def test_truncated_body():
+    body = multipart_body([("file", "a.mp3", os.urandom(50_000))])
+    result, directory = upload(split(body[:30_000], 4096))
+    assert isinstance(result, HTTPException) and result.status_code == 400
+    assert os.listdir(directory) == []
+    print("Truncated upload rejected without leaving a .part file")
+
+if __name__ == '__main__':
+    test_boundary_split_across_chunks()
+    test_large_file_written_in_buffers()
+    test_missing_file_field()
+    test_oversize_with_content_length_rejected_before_reading()
+    test_oversize_without_content_length()
+    test_truncated_body()
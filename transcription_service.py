@@ -1,4 +1,8 @@
+import math
 import os
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
 from dotenv import load_dotenv
 
@@ -6,28 +10,150 @@ load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
+# Whisper API rejects uploads over 25MB; files above this size are split
+MAX_WHISPER_FILE_SIZE = int(os.getenv("MAX_WHISPER_FILE_SIZE", str(24 * 1024 * 1024)))
+# Length of each split piece of audio in seconds
+TRANSCRIPTION_SEGMENT_SECONDS = int(os.getenv("TRANSCRIPTION_SEGMENT_SECONDS", "600"))
+# Maximum number of pieces transcribed at the same time
+TRANSCRIPTION_MAX_CONCURRENCY = int(os.getenv("TRANSCRIPTION_MAX_CONCURRENCY", "4"))
+
+
+def _segment_field(segment, name):
+    """Read a field from a Whisper segment, which may be an object or a dict"""
+    if isinstance(segment, dict):
+        return segment.get(name)
+    return getattr(segment, name, None)
+
+
+def _transcribe_file(audio_file_path: str, offset: float = 0.0) -> dict:
+    """
+    Transcribe a single file that fits within the Whisper upload limit
+
+    Args:
+        audio_file_path: Path to the audio file
+        offset: Seconds added to every segment timestamp
+
+    Returns:
+        dict with 'text', 'duration' and 'segments' keys
+    """
+    with open(audio_file_path, "rb") as audio_file:
+        transcript = client.audio.transcriptions.create(
+            model="whisper-1",
+            file=audio_file,
+            response_format="verbose_json"
+        )
+
+    segments = [
+        {
+            "start": offset + float(_segment_field(segment, "start")),
+            "end": offset + float(_segment_field(segment, "end")),
+            "text": _segment_field(segment, "text").strip()
+        }
+        for segment in (getattr(transcript, "segments", None) or [])
+    ]
+
+    return {
+        "text": transcript.text,
+        "duration": getattr(transcript, "duration", None),
+        "segments": segments
+    }
+
+
+def _audio_duration(audio_file_path: str) -> float:
+    """Length of an audio file in seconds, read by ffprobe without decoding it"""
+    from pydub.utils import mediainfo
+
+    return float(mediainfo(audio_file_path)["duration"])
+
+
+def _cut_piece(audio_file_path: str, piece_path: str, start: float, duration: float):
+    """
+    Encode one piece of an audio file with ffmpeg
+
+    ffmpeg seeks to start in the input, so only this piece is decoded, and
+    it is written as mono 64 kbps mp3 (around 5MB for 10 minutes).
+    """
+    from pydub import AudioSegment
+
+    process = subprocess.run(
+        [
+            AudioSegment.converter, "-v", "error", "-y",
+            "-ss", f"{start:.3f}", "-t", f"{duration:.3f}", "-i", audio_file_path,
+            "-vn", "-ac", "1", "-b:a", "64k", "-f", "mp3", piece_path
+        ],
+        stdin=subprocess.DEVNULL,
+        capture_output=True
+    )
+    if process.returncode != 0:
+        raise Exception(f"ffmpeg could not cut audio at {start:.0f}s: {process.stderr.decode(errors='replace').strip()}")
+
+
+def _transcribe_piece(piece_path: str, offset: float) -> dict:
+    try:
+        return _transcribe_file(piece_path, offset)
+    finally:
+        os.remove(piece_path)
+
+
+def _transcribe_large_file(audio_file_path: str) -> dict:
+    """
+    Split a long audio file into fixed-length pieces and transcribe them in parallel
+
+    Each piece is cut with an ffmpeg seek and submitted to a bounded thread
+    pool as soon as it is written, so transcription overlaps with cutting
+    and the episode is never decoded into memory as a whole. Results are
+    stitched back together in order, with segment timestamps shifted by
+    each piece's start time.
+    """
+    duration = _audio_duration(audio_file_path)
+    piece_seconds = TRANSCRIPTION_SEGMENT_SECONDS
+    starts = [index * piece_seconds for index in range(max(1, math.ceil(duration / piece_seconds)))]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with ThreadPoolExecutor(max_workers=max(1, min(TRANSCRIPTION_MAX_CONCURRENCY, len(starts)))) as executor:
+            futures = []
+            try:
+                for index, start in enumerate(starts):
+                    piece_path = os.path.join(temp_dir, f"piece_{index:04d}.mp3")
+                    _cut_piece(audio_file_path, piece_path, start, min(piece_seconds, duration - start))
+                    futures.append(executor.submit(_transcribe_piece, piece_path, start))
+                results = [future.result() for future in futures]
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    return {
+        "text": " ".join(result["text"].strip() for result in results),
+        "duration": duration,
+        "segments": [segment for result in results for segment in result["segments"]]
+    }
+
 
 def transcribe_audio(audio_file_path: str) -> dict:
     """
     Transcribe audio file using OpenAI Whisper API
 
+    Files larger than the Whisper upload limit are split into pieces that are
+    transcribed concurrently and combined in order.
+
     Args:
         audio_file_path: Path to the audio file
 
     Returns:
-        dict with 'text' and 'duration' keys
+        dict with 'text', 'duration' and 'segments' keys; each segment has
+        'start', 'end' (seconds from the start of the file) and 'text'
     """
     try:
-        with open(audio_file_path, "rb") as audio_file:
-            transcript = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file,
-                response_format="verbose_json"
-            )
+        if os.path.getsize(audio_file_path) > MAX_WHISPER_FILE_SIZE:
+            result = _transcribe_large_file(audio_file_path)
+        else:
+            result = _transcribe_file(audio_file_path)
 
         return {
-            "text": transcript.text,
-            "duration": int(transcript.duration) if hasattr(transcript, 'duration') else None
+            "text": result["text"],
+            "duration": int(result["duration"]) if result["duration"] is not None else None,
+            "segments": result["segments"]
         }
     except Exception as e:
         raise Exception(f"Transcription failed: {str(e)}")
@@ -56,3 +182,57 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list[st
         start += chunk_size - overlap
 
     return chunks
+
+
+def chunk_segments(segments: list[dict], chunk_size: int = 1000, overlap: int = 200) -> list[dict]:
+    """
+    Group transcript segments into chunks that start and end on segment boundaries
+
+    Consecutive segments are joined until the next one would exceed
+    chunk_size characters. The trailing segments of a chunk, up to overlap
+    characters, are repeated at the start of the next one.
+
+    Args:
+        segments: Segments with 'start', 'end' and 'text', in order
+        chunk_size: Maximum size of each chunk in characters
+        overlap: Maximum overlap between chunks in characters
+
+    Returns:
+        List of dicts with 'text', 'start' and 'end' keys
+    """
+    def join(group):
+        return {
+            "text": " ".join(segment["text"] for segment in group),
+            "start": group[0]["start"],
+            "end": group[-1]["end"]
+        }
+
+    chunks = []
+    current = []
+    length = 0
+
+    for segment in segments:
+        segment_text = segment["text"].strip()
+        if not segment_text:
+            continue
+
+        if current and length + len(segment_text) > chunk_size:
+            chunks.append(join(current))
+
+            # Carry the last segments (never the whole chunk) over into the next one
+            carried = []
+            carried_length = 0
+            for previous in reversed(current[1:]):
+                if carried_length + len(previous["text"]) + 1 > overlap:
+                    break
+                carried.insert(0, previous)
+                carried_length += len(previous["text"]) + 1
+            current, length = carried, carried_length
+
+        current.append({"start": segment["start"], "end": segment["end"], "text": segment_text})
+        length += len(segment_text) + 1
+
+    if current:
+        chunks.append(join(current))
+
+    return chunks
@@ -0,0 +1,185 @@
+import asyncio
+import hashlib
+import os
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from fastapi import HTTPException
+from starlette.requests import Request
+
+try:
+    import python_multipart as multipart
+    from python_multipart.multipart import parse_options_header
+except ModuleNotFoundError:
+    import multipart
+    from multipart.multipart import parse_options_header
+
+# Bytes allowed on top of the file size for the multipart boundaries and part headers
+MULTIPART_OVERHEAD = 64 * 1024
+# File data collected before each write, so a thread hop is paid per megabyte, not per network chunk
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+
+@dataclass
+class SavedUpload:
+    filename: str  # name sent by the client
+    file_path: str
+    size: int
+    content_hash: str  # sha256 hex digest
+
+
+def too_large(max_size: int) -> HTTPException:
+    return HTTPException(
+        status_code=413,
+        detail=f"File too large. Maximum size is {max_size // (1024 * 1024)}MB"
+    )
+
+
+class _FilePartCollector:
+    """python-multipart callbacks that keep the data of one file field"""
+
+    def __init__(self, field_name: str):
+        self.field_name = field_name.encode()
+        self.filename: Optional[str] = None
+        self.pending: List[bytes] = []
+        self.complete = False
+        self._in_file = False
+        self._header_field = b""
+        self._header_value = b""
+        self._disposition = b""
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._disposition = b""
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        # Only the first file sent in the field is kept
+        if self.filename is None and options.get(b"name") == self.field_name and b"filename" in options:
+            self.filename = options[b"filename"].decode("utf-8", "replace")
+            self._in_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_file:
+            self.pending.append(data[start:end])
+
+    def on_part_end(self):
+        if self._in_file:
+            self.complete = True
+        self._in_file = False
+
+
+async def receive_upload(
+    request: Request,
+    path_for: Callable[[str], str],
+    max_size: int,
+    field_name: str = "file"
+) -> SavedUpload:
+    """
+    Stream the file field of a multipart/form-data request straight to disk
+
+    The body is parsed as it arrives, so nothing is spooled to a temporary
+    file first. A Content-Length that cannot fit within max_size is rejected
+    before reading, and the size is enforced while streaming for chunked
+    requests. Data goes to a ".part" file, hashed on the way, and is renamed
+    into place once complete; writes of WRITE_BUFFER_SIZE run in a worker
+    thread.
+
+    Args:
+        request: Incoming request
+        path_for: Called with the client's filename, returns the destination
+            path; may raise HTTPException to reject the file
+        max_size: Maximum allowed file size in bytes
+        field_name: Form field holding the file
+
+    Returns:
+        The saved upload
+
+    Raises:
+        HTTPException: 400 for a malformed form or missing file, 413 when too large
+    """
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_size + MULTIPART_OVERHEAD:
+        raise too_large(max_size)
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data upload")
+
+    collector = _FilePartCollector(field_name)
+    parser = multipart.MultipartParser(params[b"boundary"], collector.callbacks())
+    digest = hashlib.sha256()
+    size = 0
+    file_path = partial_path = None
+    output = None
+    buffer: List[bytes] = []
+    buffered = 0
+
+    def write(pieces: List[bytes]):
+        data = b"".join(pieces)
+        digest.update(data)
+        output.write(data)
+
+    try:
+        async for chunk in request.stream():
+            try:
+                parser.write(chunk)
+            except Exception:
+                raise HTTPException(status_code=400, detail="Malformed multipart upload")
+
+            if collector.filename is not None and output is None:
+                file_path = path_for(collector.filename)
+                partial_path = f"{file_path}.part"
+                output = await asyncio.to_thread(open, partial_path, "wb")
+
+            if collector.pending:
+                received = sum(len(piece) for piece in collector.pending)
+                size += received
+                if size > max_size:
+                    raise too_large(max_size)
+                buffer.extend(collector.pending)
+                buffered += received
+                collector.pending.clear()
+                if buffered >= WRITE_BUFFER_SIZE:
+                    pieces, buffer, buffered = buffer, [], 0
+                    await asyncio.to_thread(write, pieces)
+
+        if output is None:
+            raise HTTPException(status_code=400, detail=f"No file uploaded in the '{field_name}' field")
+        parser.finalize()
+        if not collector.complete:
+            raise HTTPException(status_code=400, detail="Upload ended before the file was complete")
+        if buffer:
+            await asyncio.to_thread(write, buffer)
+        await asyncio.to_thread(output.close)
+        os.replace(partial_path, file_path)
+    except BaseException:
+        # Failed, oversized or abandoned uploads never leave a partial file
+        if output is not None:
+            output.close()
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        raise
+
+    return SavedUpload(filename=collector.filename, file_path=file_path, size=size, content_hash=digest.hexdigest())
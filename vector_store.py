@@ -1,103 +1,802 @@
 import chromadb
+import numpy as np
+from abc import ABC, abstractmethod
 from chromadb.config import Settings
 from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+import asyncio
+import json
 import os
+import shutil
+import threading
 from dotenv import load_dotenv
+from embedding_cache import create_embedding_cache, text_hash
+from lexical_index import LexicalIndexStore
+from transcription_service import chunk_segments
 
 load_dotenv()
 
+# Number of chunks sent to the embeddings API / written to Chroma at once
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "64"))
+# Maximum number of embedding batches in flight at the same time
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+# Directory for the persistent Chroma index; set to an empty string for an in-memory index
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "./vector_store")
+# Storage backend for vectors: "chroma" or "numpy"
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+# Retrieval mode: "hybrid" (BM25 + vectors), "vector" or "lexical" (BM25 only, no embedding calls)
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+# Collection holding the chunks of every podcast, tagged with podcast_id metadata
+GLOBAL_COLLECTION = "podcast_chunks"
+# Rank offset for reciprocal rank fusion of lexical and vector results
+RRF_K = 60
 
-class VectorStore:
-    def __init__(self):
-        self.client = chromadb.Client(Settings(
+
+class VectorBackend(ABC):
+    """Storage interface for named collections of embedded text chunks"""
+
+    @abstractmethod
+    def has_collection(self, name: str) -> bool:
+        """Check whether a collection exists"""
+
+    @abstractmethod
+    def create_collection(self, name: str):
+        """Create an empty collection, replacing any existing one with the same name"""
+
+    @abstractmethod
+    def delete_collection(self, name: str):
+        """Delete a collection and its chunks, if it exists"""
+
+    @abstractmethod
+    def add(
+        self,
+        name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict] = None
+    ):
+        """Add embedded chunks to a collection, creating it if needed"""
+
+    @abstractmethod
+    def query(self, name: str, embedding: List[float], n_results: int, where: Dict = None) -> List[Dict]:
+        """
+        Find the nearest chunks in a collection
+
+        Args:
+            where: Only consider chunks whose metadata equals these values
+
+        Returns:
+            List of dicts with 'text', 'distance' and 'metadata' keys, nearest first
+        """
+
+    @abstractmethod
+    def has_documents(self, name: str, where: Dict) -> bool:
+        """Check whether a collection holds any chunk matching the metadata filter"""
+
+    @abstractmethod
+    def delete_documents(self, name: str, where: Dict):
+        """Delete the chunks matching the metadata filter from a collection"""
+
+
+class ChromaBackend(VectorBackend):
+    """Vector backend backed by ChromaDB"""
+
+    def __init__(self, persist_directory: str = VECTOR_STORE_DIR):
+        settings = Settings(
             anonymized_telemetry=False,
             allow_reset=True
-        ))
+        )
+        if persist_directory:
+            # Collections survive restarts of the app
+            os.makedirs(persist_directory, exist_ok=True)
+            self.client = chromadb.PersistentClient(path=persist_directory, settings=settings)
+        else:
+            self.client = chromadb.Client(settings)
+
+    def has_collection(self, name: str) -> bool:
+        try:
+            self.client.get_collection(name=name)
+            return True
+        except:
+            return False
+
+    def create_collection(self, name: str):
+        self.delete_collection(name)
+        self.client.create_collection(name=name)
+
+    def get_or_create_collection(self, name: str):
+        return self.client.get_or_create_collection(name=name)
+
+    def delete_collection(self, name: str):
+        try:
+            self.client.delete_collection(name=name)
+        except:
+            pass
+
+    def add(
+        self,
+        name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict] = None
+    ):
+        collection = self.client.get_or_create_collection(name=name)
+        collection.add(
+            embeddings=embeddings,
+            documents=documents,
+            metadatas=metadatas,
+            ids=ids
+        )
+
+    def query(self, name: str, embedding: List[float], n_results: int, where: Dict = None) -> List[Dict]:
+        try:
+            collection = self.client.get_collection(name=name)
+        except:
+            return []
+
+        results = collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            where=where
+        )
+
+        # Format results
+        formatted_results = []
+        if results['documents'] and len(results['documents']) > 0:
+            metadatas = results.get('metadatas') or [[]]
+            for i, doc in enumerate(results['documents'][0]):
+                formatted_results.append({
+                    'text': doc,
+                    'distance': results['distances'][0][i] if 'distances' in results else None,
+                    'metadata': (metadatas[0][i] if i < len(metadatas[0]) else None) or {}
+                })
+
+        return formatted_results
+
+    def has_documents(self, name: str, where: Dict) -> bool:
+        try:
+            collection = self.client.get_collection(name=name)
+        except:
+            return False
+        return len(collection.get(where=where, limit=1)['ids']) > 0
+
+    def delete_documents(self, name: str, where: Dict):
+        try:
+            collection = self.client.get_collection(name=name)
+        except:
+            return
+        collection.delete(where=where)
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Local brute-force vector backend using NumPy
+
+    Each collection is a list of shards, float32 matrices searched with
+    squared L2 distance (the same metric as Chroma's default). Every add
+    call appends one shard, so writing to a large collection never rewrites
+    what is already there. With a persist directory each shard is saved as
+    one .npz file (matrix plus JSON ids/documents/metadatas) under
+    <name>.shards/, written to a temporary file and renamed into place so a
+    crash never leaves a shard half written.
+    """
+
+    def __init__(self, persist_directory: str = VECTOR_STORE_DIR):
+        self.persist_directory = persist_directory
+        self._collections = {}
+        self._lock = threading.Lock()
+        if persist_directory:
+            os.makedirs(persist_directory, exist_ok=True)
+
+    def _directory(self, name: str) -> str:
+        return os.path.join(self.persist_directory, f"{name}.shards")
+
+    def _legacy_paths(self, name: str):
+        # Single-file layout written by earlier versions
+        base = os.path.join(self.persist_directory, name)
+        return f"{base}.npy", f"{base}.json"
+
+    @staticmethod
+    def _make_shard(ids: List[str], documents: List[str], metadatas: List[Dict], embeddings, path: str = None) -> Dict:
+        """
+        Build an in-memory shard
+
+        Metadata values shared by every chunk (e.g. podcast_id in the global
+        collection, where each shard holds one podcast) are recorded so
+        filters can accept or skip the whole shard; other filtered keys get
+        a column array, built on first use, for vectorized masks.
+        """
+        shared = dict(metadatas[0]) if metadatas else {}
+        for metadata in metadatas[1:]:
+            if not shared:
+                break
+            for key in [key for key, value in shared.items() if metadata.get(key) != value]:
+                del shared[key]
+        return {
+            "path": path,
+            "ids": ids,
+            "documents": documents,
+            "metadatas": metadatas,
+            "embeddings": embeddings,
+            "shared": shared,
+            "columns": {},
+        }
+
+    @classmethod
+    def _read_shard(cls, path: str) -> Dict:
+        with np.load(path) as data:
+            meta = json.loads(data["meta"].tobytes().decode("utf-8"))
+            embeddings = data["embeddings"]
+        return cls._make_shard(meta["ids"], meta["documents"], meta["metadatas"], embeddings, path)
+
+    def _write_shard(self, collection: Dict, shard: Dict):
+        """Persist a shard atomically, assigning it a file on first write"""
+        if not self.persist_directory:
+            return
+        if shard.get("path") is None:
+            shard["path"] = os.path.join(collection["directory"], f"{collection['next_shard']:08d}.npz")
+            collection["next_shard"] += 1
+        meta = json.dumps({
+            "ids": shard["ids"],
+            "documents": shard["documents"],
+            "metadatas": shard["metadatas"]
+        }).encode("utf-8")
+        temp_path = f"{shard['path']}.tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(f, embeddings=shard["embeddings"], meta=np.frombuffer(meta, dtype=np.uint8))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, shard["path"])
+
+    def _remove_shard(self, shard: Dict):
+        if shard.get("path") and os.path.exists(shard["path"]):
+            os.remove(shard["path"])
+
+    def _load(self, name: str) -> Optional[Dict]:
+        if name in self._collections:
+            return self._collections[name]
+        if not self.persist_directory:
+            return None
+
+        directory = self._directory(name)
+        matrix_path, meta_path = self._legacy_paths(name)
+        legacy = os.path.exists(matrix_path) and os.path.exists(meta_path)
+        if not os.path.isdir(directory) and not legacy:
+            return None
+
+        os.makedirs(directory, exist_ok=True)
+        files = sorted(f for f in os.listdir(directory) if f.endswith(".npz"))
+        collection = {
+            "directory": directory,
+            "shards": [self._read_shard(os.path.join(directory, f)) for f in files],
+            "next_shard": int(files[-1].split(".")[0]) + 1 if files else 0,
+        }
+
+        if legacy:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            matrix = np.load(matrix_path)
+            if meta["ids"]:
+                shard = self._make_shard(
+                    meta["ids"],
+                    meta["documents"],
+                    meta.get("metadatas") or [{} for _ in meta["ids"]],
+                    matrix
+                )
+                self._write_shard(collection, shard)
+                collection["shards"].append(shard)
+            os.remove(matrix_path)
+            os.remove(meta_path)
+
+        self._collections[name] = collection
+        return collection
+
+    def _new_collection(self, name: str) -> Dict:
+        collection = {"directory": None, "shards": [], "next_shard": 0}
+        if self.persist_directory:
+            collection["directory"] = self._directory(name)
+            os.makedirs(collection["directory"], exist_ok=True)
+        self._collections[name] = collection
+        return collection
+
+    def has_collection(self, name: str) -> bool:
+        with self._lock:
+            return self._load(name) is not None
+
+    def create_collection(self, name: str):
+        self.delete_collection(name)
+        with self._lock:
+            self._new_collection(name)
+
+    def delete_collection(self, name: str):
+        with self._lock:
+            self._collections.pop(name, None)
+            if self.persist_directory:
+                shutil.rmtree(self._directory(name), ignore_errors=True)
+                for path in self._legacy_paths(name):
+                    if os.path.exists(path):
+                        os.remove(path)
+
+    def add(
+        self,
+        name: str,
+        ids: List[str],
+        embeddings: List[List[float]],
+        documents: List[str],
+        metadatas: List[Dict] = None
+    ):
+        if not ids:
+            return
+        shard = self._make_shard(
+            list(ids),
+            list(documents),
+            list(metadatas or [{} for _ in ids]),
+            np.asarray(embeddings, dtype=np.float32)
+        )
+        with self._lock:
+            collection = self._load(name)
+            if collection is None:
+                collection = self._new_collection(name)
+            self._write_shard(collection, shard)
+            collection["shards"].append(shard)
+
+    @staticmethod
+    def _shard_mask(shard: Dict, where: Dict):
+        """
+        Match a shard's chunks against a metadata filter
+
+        Returns:
+            True if every chunk matches, False if none can, otherwise a boolean array
+        """
+        mask = None
+        for key, value in where.items():
+            if key in shard["shared"]:
+                if shard["shared"][key] != value:
+                    return False
+                continue
+            column = shard["columns"].get(key)
+            if column is None:
+                column = np.array([metadata.get(key) for metadata in shard["metadatas"]], dtype=object)
+                shard["columns"][key] = column
+            key_mask = column == value
+            mask = key_mask if mask is None else mask & key_mask
+        if mask is None:
+            return True
+        return mask if mask.any() else False
+
+    def query(self, name: str, embedding: List[float], n_results: int, where: Dict = None) -> List[Dict]:
+        with self._lock:
+            collection = self._load(name)
+            if collection is None:
+                return []
+            shards = list(collection["shards"])
+
+        query = np.asarray(embedding, dtype=np.float32)
+        distances, documents, metadatas = [], [], []
+        for shard in shards:
+            mask = self._shard_mask(shard, where) if where else True
+            if mask is False:
+                continue
+            shard_distances = ((shard["embeddings"] - query) ** 2).sum(axis=1)
+            if mask is not True:
+                shard_distances = np.where(mask, shard_distances, np.inf)
+            distances.append(shard_distances)
+            documents.extend(shard["documents"])
+            metadatas.extend(shard["metadatas"])
+        if not documents:
+            return []
+
+        distances = np.concatenate(distances)
+        k = min(n_results, len(distances))
+        nearest = np.argpartition(distances, k - 1)[:k]
+        nearest = nearest[np.argsort(distances[nearest])]
+
+        return [
+            {'text': documents[i], 'distance': float(distances[i]), 'metadata': metadatas[i]}
+            for i in nearest
+            if np.isfinite(distances[i])
+        ]
+
+    def has_documents(self, name: str, where: Dict) -> bool:
+        with self._lock:
+            collection = self._load(name)
+            return collection is not None and any(
+                self._shard_mask(shard, where) is not False for shard in collection["shards"]
+            )
+
+    def delete_documents(self, name: str, where: Dict):
+        """Drop matching chunks; only the shards that contain them are rewritten or removed"""
+        with self._lock:
+            collection = self._load(name)
+            if collection is None:
+                return
+            shards = []
+            for shard in collection["shards"]:
+                mask = self._shard_mask(shard, where)
+                if mask is False:
+                    shards.append(shard)
+                elif mask is True:
+                    self._remove_shard(shard)
+                else:
+                    # A new shard object, so queries already reading the old one are unaffected
+                    keep = np.flatnonzero(~mask)
+                    shard = self._make_shard(
+                        [shard["ids"][i] for i in keep],
+                        [shard["documents"][i] for i in keep],
+                        [shard["metadatas"][i] for i in keep],
+                        shard["embeddings"][keep],
+                        shard["path"]
+                    )
+                    self._write_shard(collection, shard)
+                    shards.append(shard)
+            collection["shards"] = shards
+
+
+def create_backend(name: str = VECTOR_STORE_BACKEND, persist_directory: str = VECTOR_STORE_DIR) -> VectorBackend:
+    """Create the vector backend selected by name"""
+    if name == "chroma":
+        return ChromaBackend(persist_directory)
+    if name == "numpy":
+        return NumpyBackend(persist_directory)
+    raise ValueError(f"Unknown vector store backend: {name}")
+
+
+class VectorStore:
+    def __init__(
+        self,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        backend: VectorBackend = None,
+        embedding_cache=None,
+        lexical_indexes: LexicalIndexStore = None,
+        search_mode: str = SEARCH_MODE
+    ):
+        self.backend = backend if backend is not None else create_backend()
+        self.lexical_indexes = lexical_indexes if lexical_indexes is not None else LexicalIndexStore(VECTOR_STORE_DIR)
+        self.search_mode = search_mode
         self.embeddings = OpenAIEmbeddings(openai_api_key=os.getenv("OPENAI_API_KEY"))
+        self.embedding_model = getattr(self.embeddings, "model", "default")
+        self.embedding_cache = embedding_cache if embedding_cache is not None else create_embedding_cache()
         self.text_splitter = RecursiveCharacterTextSplitter(
             chunk_size=1000,
             chunk_overlap=200,
             length_function=len,
         )
+        self.batch_size = max(1, batch_size)
+        self.max_concurrency = max(1, max_concurrency)
 
-    def create_collection_for_podcast(self, podcast_id: int, transcription_text: str):
+    def create_collection_for_podcast(self, podcast_id: int, transcription_text: str, segments: List[Dict] = None):
         """
         Create a vector store collection for a podcast transcription
 
+        With Whisper segments, chunks follow segment boundaries and carry their
+        start and end times as metadata; otherwise the text is split by size.
+
         Args:
             podcast_id: ID of the podcast
             transcription_text: Full transcription text
+            segments: Transcript segments with 'start', 'end' and 'text', if available
         """
         collection_name = f"podcast_{podcast_id}"
 
-        # Delete collection if it exists
-        try:
-            self.client.delete_collection(name=collection_name)
-        except:
-            pass
-
-        # Create new collection
-        collection = self.client.create_collection(name=collection_name)
+        # Create new collection, replacing any existing one
+        self.backend.create_collection(collection_name)
+        self.backend.delete_documents(GLOBAL_COLLECTION, {"podcast_id": podcast_id})
 
         # Split text into chunks
-        chunks = self.text_splitter.split_text(transcription_text)
-
-        # Generate embeddings and add to collection
-        for i, chunk in enumerate(chunks):
-            embedding = self.embeddings.embed_query(chunk)
-            collection.add(
-                embeddings=[embedding],
-                documents=[chunk],
-                ids=[f"chunk_{i}"]
-            )
+        if segments:
+            pieces = chunk_segments(segments, chunk_size=1000, overlap=200)
+            chunks = [piece["text"] for piece in pieces]
+            times = [{"start": piece["start"], "end": piece["end"]} for piece in pieces]
+        else:
+            chunks = self.text_splitter.split_text(transcription_text)
+            times = None
+
+        # Build the BM25 index from the same chunks
+        self.lexical_indexes.build(collection_name, chunks, times)
+
+        # Generate embeddings in batches and add them to the collection in bulk
+        self._add_chunks(collection_name, chunks, podcast_id, times)
 
         return len(chunks)
 
-    def search(self, podcast_id: int, query: str, n_results: int = 5) -> List[Dict]:
+    def _add_chunks(self, collection_name: str, chunks: List[str], podcast_id: int, times: List[Dict] = None):
+        """
+        Embed chunks in batches and write each batch to the collection
+
+        Batches are embedded concurrently (bounded by max_concurrency) with
+        embed_documents, then written with one backend add call per batch to
+        the podcast's collection. The global collection gets all of the
+        podcast's chunks in a single add once every batch is embedded.
+
+        Args:
+            collection_name: Collection to write to
+            chunks: Text chunks, in transcript order
+            podcast_id: ID of the podcast, stored as metadata in the global collection
+            times: Start and end time of each chunk, stored as metadata
+        """
+        batches = [
+            (start, chunks[start:start + self.batch_size])
+            for start in range(0, len(chunks), self.batch_size)
+        ]
+        if not batches:
+            return
+
+        def embed_batch(batch):
+            start, texts = batch
+            return start, texts, self._embed_documents(texts)
+
+        global_ids, global_embeddings, global_metadatas = [], [], []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(batches))) as executor:
+            for start, texts, embeddings in executor.map(embed_batch, batches):
+                batch_times = times[start:start + len(texts)] if times else None
+                self.backend.add(
+                    collection_name,
+                    ids=[f"chunk_{start + i}" for i in range(len(texts))],
+                    embeddings=embeddings,
+                    documents=texts,
+                    metadatas=batch_times
+                )
+                global_ids.extend(f"podcast_{podcast_id}_chunk_{start + i}" for i in range(len(texts)))
+                global_embeddings.extend(embeddings)
+                global_metadatas.extend(
+                    {"podcast_id": podcast_id, "chunk": start + i, **(batch_times[i] if batch_times else {})}
+                    for i in range(len(texts))
+                )
+
+        # One write per podcast to the global collection, which holds the whole catalog
+        self.backend.add(
+            GLOBAL_COLLECTION,
+            ids=global_ids,
+            embeddings=global_embeddings,
+            documents=chunks,
+            metadatas=global_metadatas
+        )
+
+    def _embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """Embed texts, reusing cached vectors for text that was embedded before"""
+        if self.embedding_cache is None:
+            return self.embeddings.embed_documents(texts)
+
+        cached = self.embedding_cache.get_many(self.embedding_model, texts)
+        missing = list(dict.fromkeys(
+            text for text in texts if text_hash(text) not in cached
+        ))
+        if missing:
+            vectors = self.embeddings.embed_documents(missing)
+            self.embedding_cache.put_many(self.embedding_model, missing, vectors)
+            cached.update(zip((text_hash(text) for text in missing), vectors))
+
+        return [cached[text_hash(text)] for text in texts]
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a search query, reusing the cached vector for repeated queries"""
+        if self.embedding_cache is None:
+            return self.embeddings.embed_query(query)
+
+        cached = self.embedding_cache.get_many(self.embedding_model, [query])
+        if cached:
+            return cached[text_hash(query)]
+
+        embedding = self.embeddings.embed_query(query)
+        self.embedding_cache.put_many(self.embedding_model, [query], [embedding])
+        return embedding
+
+    async def aembed_query(self, query: str) -> List[float]:
+        """Async variant of embed_query that awaits the embeddings API"""
+        if self.embedding_cache is None:
+            return await self.embeddings.aembed_query(query)
+
+        cached = await asyncio.to_thread(self.embedding_cache.get_many, self.embedding_model, [query])
+        if cached:
+            return cached[text_hash(query)]
+
+        embedding = await self.embeddings.aembed_query(query)
+        await asyncio.to_thread(self.embedding_cache.put_many, self.embedding_model, [query], [embedding])
+        return embedding
+
+    def search(
+        self,
+        podcast_id: int,
+        query: str,
+        n_results: int = 5,
+        query_embedding: List[float] = None
+    ) -> List[Dict]:
         """
         Search for relevant chunks in the podcast transcription
 
+        In hybrid mode BM25 and vector results are fused by rank. If the query
+        cannot be embedded, the lexical results are returned on their own.
+
         Args:
             podcast_id: ID of the podcast
             query: Search query
             n_results: Number of results to return
+            query_embedding: Precomputed embedding of the query, if available
 
         Returns:
             List of relevant text chunks with metadata
         """
         collection_name = f"podcast_{podcast_id}"
+        lexical_index = self.lexical_indexes.get(collection_name) if self.search_mode != "vector" else None
+        lexical_results = lexical_index.search(query, n_results * 2) if lexical_index else None
 
-        try:
-            collection = self.client.get_collection(name=collection_name)
-        except:
-            return []
+        vector_results = None
+        if self.search_mode != "lexical" and self.backend.has_collection(collection_name):
+            try:
+                # Generate query embedding
+                if query_embedding is None:
+                    query_embedding = self.embed_query(query)
 
-        # Generate query embedding
-        query_embedding = self.embeddings.embed_query(query)
+                # Search
+                vector_results = self.backend.query(collection_name, query_embedding, n_results * 2)
+            except Exception as e:
+                if lexical_results is None:
+                    raise
+                print(f"Vector search failed, using lexical results only: {str(e)}")
 
-        # Search
-        results = collection.query(
-            query_embeddings=[query_embedding],
-            n_results=n_results
-        )
+        return fuse_results(vector_results, lexical_results, n_results)
 
-        # Format results
-        formatted_results = []
-        if results['documents'] and len(results['documents']) > 0:
-            for i, doc in enumerate(results['documents'][0]):
-                formatted_results.append({
-                    'text': doc,
-                    'distance': results['distances'][0][i] if 'distances' in results else None
-                })
+    async def asearch(
+        self,
+        podcast_id: int,
+        query: str,
+        n_results: int = 5,
+        query_embedding: List[float] = None
+    ) -> List[Dict]:
+        """
+        Async variant of search for use from request handlers
 
-        return formatted_results
+        The embedding call is awaited; local index work runs in a thread.
 
-    def delete_podcast_collection(self, podcast_id: int):
-        """Delete the vector store collection for a podcast"""
+        Args:
+            podcast_id: ID of the podcast
+            query: Search query
+            n_results: Number of results to return
+            query_embedding: Precomputed embedding of the query, if available
+
+        Returns:
+            List of relevant text chunks with metadata
+        """
         collection_name = f"podcast_{podcast_id}"
-        try:
-            self.client.delete_collection(name=collection_name)
-        except:
-            pass
+        lexical_results = None
+        if self.search_mode != "vector":
+            lexical_index = await asyncio.to_thread(self.lexical_indexes.get, collection_name)
+            if lexical_index:
+                lexical_results = await asyncio.to_thread(lexical_index.search, query, n_results * 2)
+
+        vector_results = None
+        if self.search_mode != "lexical" and await asyncio.to_thread(self.backend.has_collection, collection_name):
+            try:
+                if query_embedding is None:
+                    query_embedding = await self.aembed_query(query)
+
+                vector_results = await asyncio.to_thread(
+                    self.backend.query, collection_name, query_embedding, n_results * 2
+                )
+            except Exception as e:
+                if lexical_results is None:
+                    raise
+                print(f"Vector search failed, using lexical results only: {str(e)}")
+
+        return fuse_results(vector_results, lexical_results, n_results)
+
+    async def asearch_all(
+        self,
+        query: str,
+        n_results: int = 10,
+        podcast_id: Optional[int] = None,
+        query_embedding: List[float] = None
+    ) -> List[Dict]:
+        """
+        Search the chunks of every podcast with one query on the global collection
+
+        The embedding call is awaited; the backend query runs in a thread.
+
+        Args:
+            query: Search query
+            n_results: Number of results to return
+            podcast_id: Only return chunks of this podcast
+            query_embedding: Precomputed embedding of the query, if available
+
+        Returns:
+            List of dicts with 'podcast_id', 'text', 'distance', 'start' and
+            'end' keys, nearest first; times are None for chunks without them
+        """
+        if query_embedding is None:
+            query_embedding = await self.aembed_query(query)
+        where = {"podcast_id": podcast_id} if podcast_id is not None else None
+        results = await asyncio.to_thread(
+            self.backend.query, GLOBAL_COLLECTION, query_embedding, n_results, where
+        )
+        return _with_podcast_ids(results)
+
+    def is_indexed(self, podcast_id: int) -> bool:
+        """Check whether the vector collection, the global chunks and the lexical index exist for a podcast"""
+        collection_name = f"podcast_{podcast_id}"
+        return (
+            self.backend.has_collection(collection_name)
+            and self.backend.has_documents(GLOBAL_COLLECTION, {"podcast_id": podcast_id})
+            and self.lexical_indexes.get(collection_name) is not None
+        )
+
+    def delete_podcast_collection(self, podcast_id: int):
+        """Delete the vector store collection, global chunks and lexical index for a podcast"""
+        self.backend.delete_collection(f"podcast_{podcast_id}")
+        self.backend.delete_documents(GLOBAL_COLLECTION, {"podcast_id": podcast_id})
+        self.lexical_indexes.delete(f"podcast_{podcast_id}")
+
+
+def _with_podcast_ids(results: List[Dict]) -> List[Dict]:
+    """Flatten global collection results into dicts carrying the podcast ID"""
+    return [
+        {
+            'podcast_id': result['metadata'].get('podcast_id'),
+            'text': result['text'],
+            'distance': result['distance'],
+            'start': result['metadata'].get('start'),
+            'end': result['metadata'].get('end')
+        }
+        for result in results
+    ]
+
+
+def fuse_results(
+    vector_results: Optional[List[Dict]],
+    lexical_results: Optional[List[Dict]],
+    n_results: int
+) -> List[Dict]:
+    """
+    Merge vector and BM25 results with reciprocal rank fusion
+
+    Each chunk scores 1 / (RRF_K + rank) for every list it appears in, so
+    chunks ranked well by both retrievers come first. When only one list
+    is available it is returned as is.
+
+    Returns:
+        List of dicts with 'text', 'distance' (None for lexical-only hits),
+        'score', 'start' and 'end' keys; times are None for chunks without them
+    """
+    if not lexical_results:
+        return [_fused_entry(result, result.get('distance'), None) for result in (vector_results or [])[:n_results]]
+    if vector_results is None:
+        return [_fused_entry(result, None, result['score']) for result in lexical_results[:n_results]]
+
+    fused = {}
+    for results in (vector_results, lexical_results):
+        for rank, result in enumerate(results):
+            entry = fused.setdefault(result['text'], _fused_entry(result, None, 0.0))
+            entry['score'] += 1.0 / (RRF_K + rank + 1)
+            if result.get('distance') is not None:
+                entry['distance'] = result['distance']
+
+    return sorted(fused.values(), key=lambda entry: entry['score'], reverse=True)[:n_results]
+
+
+def _fused_entry(result: Dict, distance: Optional[float], score: Optional[float]) -> Dict:
+    """Build a search result, taking the chunk's time range from its metadata"""
+    metadata = result.get('metadata') or {}
+    return {
+        'text': result['text'],
+        'distance': distance,
+        'score': score,
+        'start': metadata.get('start'),
+        'end': metadata.get('end')
+    }
+
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
+
+def get_vector_store() -> VectorStore:
+    """Return the process-wide VectorStore, creating it on first use"""
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = VectorStore()
+        return _vector_store